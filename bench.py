@@ -0,0 +1,366 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Load test for the form funnel against a local stand-in of the Telegram Bot API.
+
+Starts a fake Bot API (aiohttp: getMe, getUpdates, sendMessage, editMessageText,
+sendDocument, sendPhoto, sendMediaGroup, answerCallbackQuery, getFile, …), runs the bot
+from bot.build_application() against it with polling, and drives simulated users
+through form_entry -> … -> form_photo_file -> user_paid_clicked -> admin_mark_paid_clicked
+(or, with --ipn, a PayPal notification verified by the stand-in's /cgi-bin/webscr).
+
+Reports throughput, p50/p95/p99 latency per step and peak RSS of the process
+(fake API + bot + driver, all in one process).
+
+    python bench.py --users 2000 --concurrency 200
+    python bench.py --users 200 --real-limits   # keep Telegram's 30/s and 1/s per chat
+    python bench.py --users 200 --ipn           # payments confirmed by PayPal IPN, not the admin
+"""
+
+import argparse
+import asyncio
+import contextlib
+import itertools
+import json
+import logging
+import os
+import resource
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from urllib.parse import urlencode
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from aiohttp import web
+
+ADMIN_ID = 7782365882  # bot.ADMIN_CHAT_ID, checked after import
+
+
+def _sample_upload() -> bytes:
+    """Content of every downloaded file: a phone-sized JPEG if Pillow is there."""
+    try:
+        from PIL import Image
+    except ImportError:
+        return b"%PDF-1.4 bench"
+    import io
+    out = io.BytesIO()
+    Image.new("RGB", (3000, 4000), (90, 120, 200)).save(out, "JPEG", quality=90)
+    return out.getvalue()
+
+
+USER_ID_BASE = 1_000_000
+
+STEPS = [
+    "form_entry", "form_name", "form_dob", "form_nationality", "form_passport_number",
+    "form_phone", "form_email", "form_passport_file", "form_photo_file",
+    "user_paid_clicked", "admin_mark_paid_clicked", "paypal_ipn",
+]
+
+
+# =========================
+# Fake Bot API
+# =========================
+
+class FakeBotAPI:
+    """Just enough of the Bot API for bot.py; records every call and its chat."""
+
+    def __init__(self) -> None:
+        self.updates: "asyncio.Queue[Dict[str, Any]]" = asyncio.Queue()
+        self.calls: Dict[str, int] = defaultdict(int)
+        self._update_ids = itertools.count(1)
+        self._message_ids = itertools.count(1)
+        self._waiters: Dict[int, List[asyncio.Future]] = defaultdict(list)
+        self.sample_file = _sample_upload()
+
+    # --- driver side ---
+
+    def push(self, update: Dict[str, Any]) -> None:
+        update["update_id"] = next(self._update_ids)
+        self.updates.put_nowait(update)
+
+    def expect(self, chat_id: int) -> "asyncio.Future[str]":
+        """Future resolved with the method name of the next message sent/edited in chat_id."""
+        fut = asyncio.get_running_loop().create_future()
+        self._waiters[chat_id].append(fut)
+        return fut
+
+    # --- API side ---
+
+    def _message(self, chat_id: int, text: Optional[str] = None) -> Dict[str, Any]:
+        return {
+            "message_id": next(self._message_ids),
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "text": text or "",
+        }
+
+    async def _get_updates(self, params: Dict[str, Any]) -> List[Dict[str, Any]]:
+        timeout = float(params.get("timeout", 0) or 0)
+        limit = int(params.get("limit", 100) or 100)
+        batch: List[Dict[str, Any]] = []
+        try:
+            batch.append(await asyncio.wait_for(self.updates.get(), timeout=max(timeout, 0.01)))
+        except asyncio.TimeoutError:
+            return []
+        while len(batch) < limit and not self.updates.empty():
+            batch.append(self.updates.get_nowait())
+        return batch
+
+    async def handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        params: Dict[str, Any] = dict(await request.post()) if request.can_read_body else {}
+        if not params and request.content_type == "application/json":
+            params = await request.json()
+        self.calls[method] += 1
+
+        if method == "getMe":
+            result: Any = {"id": 1, "is_bot": True, "first_name": "Bench", "username": "bench_bot"}
+        elif method == "getUpdates":
+            result = await self._get_updates(params)
+        elif method == "getFile":
+            file_id = params["file_id"]
+            result = {"file_id": file_id, "file_unique_id": f"u{file_id}",
+                      "file_size": len(self.sample_file), "file_path": f"files/{file_id}"}
+        elif method == "sendMediaGroup":
+            chat_id = int(params["chat_id"])
+            result = [self._message(chat_id) for _ in json.loads(params["media"])]
+        elif method.startswith("send") or method.startswith("edit"):
+            chat_id = int(params["chat_id"])
+            result = self._message(chat_id, params.get("text"))
+        else:
+            # deleteWebhook, answerCallbackQuery, answerInlineQuery, setWebhook …
+            result = True
+
+        chat = params.get("chat_id")
+        if chat is not None and (method.startswith("send") or method.startswith("edit")):
+            waiters = self._waiters.get(int(chat))
+            if waiters:
+                fut = waiters.pop(0)
+                if not fut.done():
+                    fut.set_result(method)
+        return web.json_response({"ok": True, "result": result})
+
+    async def ipn_verify(self, request: web.Request) -> web.Response:
+        # PayPal's IPN verification endpoint: every notification posted back is genuine here
+        self.calls["ipn_verify"] += 1
+        body = await request.read()
+        return web.Response(text="VERIFIED" if body.startswith(b"cmd=_notify-validate&") else "INVALID")
+
+    async def download(self, request: web.Request) -> web.Response:
+        self.calls["download"] += 1
+        return web.Response(body=self.sample_file, content_type="application/octet-stream")
+
+    async def start(self, port: int = 0) -> web.AppRunner:
+        app = web.Application(client_max_size=10 * 1024 ** 2)
+        app.router.add_post("/bot{token}/{method}", self.handle)
+        app.router.add_get("/file/bot{token}/{path:.+}", self.download)
+        app.router.add_post("/cgi-bin/webscr", self.ipn_verify)
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", port)
+        await site.start()
+        return runner
+
+
+# =========================
+# Simulated users
+# =========================
+
+_NO_LOCK = contextlib.nullcontext()
+
+
+def _user(uid: int) -> Dict[str, Any]:
+    return {"id": uid, "is_bot": False, "first_name": f"User{uid}"}
+
+
+def _message(uid: int, **fields: Any) -> Dict[str, Any]:
+    msg = {"message_id": 1, "date": int(time.time()), "chat": {"id": uid, "type": "private"}, "from": _user(uid)}
+    msg.update(fields)
+    return {"message": msg}
+
+
+def _callback(uid: int, data: str, chat_id: Optional[int] = None) -> Dict[str, Any]:
+    chat_id = chat_id or uid
+    return {"callback_query": {
+        "id": f"{uid}-{time.monotonic_ns()}",
+        "from": _user(uid),
+        "chat_instance": str(chat_id),
+        "data": data,
+        "message": {"message_id": 1, "date": int(time.time()), "chat": {"id": chat_id, "type": "private"}},
+    }}
+
+
+def _funnel(uid: int, ipn: bool = False) -> List[Any]:
+    """(step, update, chat to wait for) for one user; update None — the PayPal notification."""
+    steps = [
+        ("form_entry", _callback(uid, "fill_form"), uid),
+        ("form_name", _message(uid, text="John Smith"), uid),
+        ("form_dob", _message(uid, text="1990-12-31"), uid),
+        ("form_nationality", _message(uid, text="India"), uid),
+        ("form_passport_number", _message(uid, text="X1234567"), uid),
+        ("form_phone", _message(uid, text="+10000000000"), uid),
+        ("form_email", _message(uid, text="john@example.com"), uid),
+        ("form_passport_file", _message(uid, document={
+            "file_id": f"doc-{uid}", "file_unique_id": f"udoc-{uid}", "file_name": "passport.pdf",
+            "mime_type": "application/pdf"}), uid),
+        ("form_photo_file", _message(uid, photo=[
+            {"file_id": f"photo-{uid}", "file_unique_id": f"uphoto-{uid}", "width": 600, "height": 800}]), uid),
+        ("user_paid_clicked", _callback(uid, "user_paid"), uid),
+        # the admin confirms; the final message goes to the user's chat
+        ("admin_mark_paid_clicked", _callback(ADMIN_ID, f"admin_mark_paid:{uid}"), uid),
+    ]
+    if ipn:
+        # PayPal confirms instead of the admin; the final message still goes to the user's chat
+        steps[-1] = ("paypal_ipn", None, uid)
+    return steps
+
+
+async def run_user(api: FakeBotAPI, uid: int, latencies: Dict[str, List[float]], timeout: float,
+                   admin: asyncio.Lock, ipn: Optional[Callable[[int], Awaitable[Any]]] = None) -> bool:
+    for step, update, chat_id in _funnel(uid, ipn is not None):
+        # there is one admin: confirmations are pressed one after another
+        async with admin if step == "admin_mark_paid_clicked" else _NO_LOCK:
+            waiter = api.expect(chat_id)
+            started = time.perf_counter()
+            if update is None:
+                await ipn(uid)
+            else:
+                api.push(update)
+            try:
+                await asyncio.wait_for(waiter, timeout)
+            except asyncio.TimeoutError:
+                latencies[f"{step} (timeout)"].append(timeout)
+                return False
+            latencies[step].append(time.perf_counter() - started)
+    return True
+
+
+# =========================
+# Report
+# =========================
+
+def percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q / 100 * (len(ordered) - 1))))]
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / 1024 ** 2 if sys.platform == "darwin" else rss / 1024
+
+
+def report(latencies: Dict[str, List[float]], done: int, users: int, elapsed: float, calls: Dict[str, int]) -> str:
+    updates = sum(len(v) for v in latencies.values())
+    lines = [
+        f"users: {done}/{users} completed in {elapsed:.2f}s",
+        f"throughput: {done / elapsed:.1f} funnels/s, {updates / elapsed:.1f} updates/s",
+        f"peak RSS: {peak_rss_mb():.1f} MiB",
+        "",
+        f"{'step':<28}{'n':>7}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}",
+    ]
+    for step in STEPS + sorted(k for k in latencies if k not in STEPS):
+        values = latencies.get(step)
+        if not values:
+            continue
+        lines.append(
+            f"{step:<28}{len(values):>7}"
+            f"{percentile(values, 50) * 1000:>10.1f}{percentile(values, 95) * 1000:>10.1f}"
+            f"{percentile(values, 99) * 1000:>10.1f}"
+        )
+    lines += ["", "Bot API calls: " + ", ".join(f"{m}={n}" for m, n in sorted(calls.items()))]
+    return "\n".join(lines)
+
+
+# =========================
+# Main
+# =========================
+
+async def bench(args: argparse.Namespace) -> int:
+    api = FakeBotAPI()
+    runner = await api.start()
+    port = runner.addresses[0][1]
+
+    # configure bot.py before importing it
+    os.environ["TELEGRAM_API_URL"] = f"http://127.0.0.1:{port}"
+    workdir = tempfile.mkdtemp(prefix="bench-")
+    os.environ.setdefault("FORMS_DB_PATH", os.path.join(workdir, "forms.sqlite3"))
+    os.environ.setdefault("STATE_SNAPSHOT_PATH", os.path.join(workdir, "state.pickle"))
+    os.environ.setdefault("DOCUMENTS_DIR", os.path.join(workdir, "documents"))
+    os.environ.setdefault("PAYPAL_IPN_VERIFY_URL", f"http://127.0.0.1:{port}/cgi-bin/webscr")
+    os.environ.setdefault("PAYMENT_REF_SECRET", "bench")
+    if not args.real_limits:
+        os.environ.setdefault("TG_GLOBAL_RATE", "100000")
+        os.environ.setdefault("TG_CHAT_RATE", "100000")
+        os.environ.setdefault("TG_CHAT_BURST", "100000")
+    import bot  # noqa: E402  (heavy import on purpose after env setup)
+    from payments import order_ref  # noqa: E402
+    from polling import AdaptivePoller, allowed_updates_for  # noqa: E402
+    assert bot.ADMIN_CHAT_ID == ADMIN_ID, "update ADMIN_ID in bench.py"
+    logging.getLogger().setLevel(logging.WARNING)  # no per-request httpx/aiohttp logs
+
+    app = bot.build_application()
+    await bot.FORMS.start()
+    bot.DOCUMENTS.start()
+    await app.initialize()
+    await app.start()
+    allowed = allowed_updates_for(h for group in app.handlers.values() for h in group)
+    poller = AdaptivePoller(app.bot, app.update_queue, allowed, capacity=bot.POLL_CAPACITY,
+                            backlog=lambda: app.update_queue.qsize() + app.update_processor.in_flight,
+                            max_timeout=10, observer=bot.observe_updates)
+    await poller.start()
+    await bot.PAYMENTS.start()
+
+    async def send_ipn(uid: int) -> None:
+        # what PayPal posts to /paypal/ipn for the link in payment_kb()
+        body = urlencode({
+            "txn_type": "web_accept", "payment_status": "Completed", "txn_id": f"TXN{uid}",
+            "mc_gross": bot.PAYMENT_AMOUNT, "mc_currency": bot.PAYMENT_CURRENCY, "charset": "utf-8",
+            "invoice": order_ref(uid, bot.PAYMENT_REF_SECRET), "receiver_email": bot.PAYPAL_RECEIVER_EMAIL,
+        }).encode()
+        status = await bot.PAYMENTS.handle(body)
+        assert status == 200, status
+
+    latencies: Dict[str, List[float]] = defaultdict(list)
+    gate = asyncio.Semaphore(args.concurrency)
+    admin = asyncio.Lock()
+
+    async def one(uid: int) -> bool:
+        async with gate:
+            return await run_user(api, uid, latencies, args.timeout, admin, send_ipn if args.ipn else None)
+
+    started = time.perf_counter()
+    results = await asyncio.gather(*(one(USER_ID_BASE + i) for i in range(args.users)))
+    elapsed = time.perf_counter() - started
+
+    await poller.stop()
+    await bot.PENDING_DIGEST.close()
+    await bot.PAYMENTS.close()
+    await app.stop()
+    await app.shutdown()
+    await bot.DOCUMENTS.close()
+    await bot.FORMS.close()
+    await runner.cleanup()
+
+    print(report(latencies, sum(results), args.users, elapsed, api.calls))
+    return 0 if all(results) else 1
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=1000, help="simulated users (default: 1000)")
+    parser.add_argument("--concurrency", type=int, default=100, help="users in flight at once (default: 100)")
+    parser.add_argument("--timeout", type=float, default=30.0, help="max seconds per step (default: 30)")
+    parser.add_argument("--real-limits", action="store_true",
+                        help="keep the configured Telegram rate limits instead of lifting them")
+    parser.add_argument("--ipn", action="store_true",
+                        help="confirm payments with PayPal notifications instead of the admin's button")
+    sys.exit(asyncio.run(bench(parser.parse_args())))
+
+
+if __name__ == "__main__":
+    main()
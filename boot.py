@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Entry point with a staged cold start (Render free tier sleeps and wakes a lot).
+
+1. Only aiohttp is imported, and the HTTP server is bound at once: /live
+   answers right away and the platform sees a listening port.
+2. bot.py and the telegram stack are imported in a thread, so the event loop
+   keeps answering meanwhile.
+3. bot.serve() builds and initializes the Application, registers the bot's
+   HTTP handlers (webhook, /metrics, /export) and marks the process ready.
+
+/live    — the process is up (200 from the first moment).
+/ready   — the bot receives and handles updates (503 while starting or stopping),
+           with the timings of the startup phases as JSON. /health is the same.
+/        — keep-alive ping, always "OK".
+
+Phase timings (seconds since the interpreter started this file) are logged
+once ready and exported as visa_bot_startup_seconds{phase}.
+
+With TENANTS_DIR set, the bots configured there run side by side in this
+process (see tenants.py); their routes are under /t/<name>/.
+"""
+
+import time
+
+BOOT_STARTED = time.perf_counter()  # before any heavy import
+
+import asyncio  # noqa: E402
+import importlib  # noqa: E402
+import logging  # noqa: E402
+import os  # noqa: E402
+import signal  # noqa: E402
+import sys  # noqa: E402
+from typing import Awaitable, Callable, Dict, List, Tuple  # noqa: E402
+
+from aiohttp import web  # noqa: E402
+
+from logs import setup_logging  # noqa: E402
+
+logger = logging.getLogger("boot")
+
+Handler = Callable[[web.Request], Awaitable[web.StreamResponse]]
+
+
+class Startup:
+    """Startup phases and the handlers the bot registers once it is loaded."""
+
+    def __init__(self) -> None:
+        self.phases: List[Tuple[str, float]] = []
+        self.state = "starting"  # starting -> ready -> stopping (or failed)
+        self.handlers: Dict[str, Handler] = {}
+
+    def mark(self, phase: str) -> None:
+        self.phases.append((phase, round(time.perf_counter() - BOOT_STARTED, 3)))
+
+    def serve(self, handlers: Dict[str, Handler]) -> None:
+        self.handlers.update(handlers)
+
+    def set_state(self, state: str) -> None:
+        self.state = state
+        if state == "ready":
+            self.mark("ready")
+            logger.info("Cold start: %s", self.report())
+
+    @property
+    def ready(self) -> bool:
+        return self.state == "ready"
+
+    def report(self) -> str:
+        return ", ".join(f"{name} {seconds:.2f}s" for name, seconds in self.phases)
+
+
+STARTUP = Startup()
+
+
+# =========================
+# HTTP
+# =========================
+
+async def _keepalive(request: web.Request) -> web.Response:
+    return web.Response(text="OK")
+
+
+async def _live(request: web.Request) -> web.Response:
+    return web.json_response({"status": "alive", "uptime": round(time.perf_counter() - BOOT_STARTED, 3)})
+
+
+async def _ready(request: web.Request) -> web.Response:
+    return web.json_response(
+        {"status": STARTUP.state, "phases": dict(STARTUP.phases)},
+        status=200 if STARTUP.ready else 503,
+    )
+
+
+def _deferred(name: str) -> Handler:
+    """Route whose handler is provided by bot.py once it is loaded; 503 until then, 404 if it provides none."""
+    async def handler(request: web.Request) -> web.StreamResponse:
+        target = STARTUP.handlers.get(name)
+        if target is None:
+            if STARTUP.ready:
+                raise web.HTTPNotFound()  # e.g. /export without EXPORT_TOKEN, webhook while polling
+            raise web.HTTPServiceUnavailable(headers={"Retry-After": "5"})
+        return await target(request)
+
+    return handler
+
+
+def _tenant_deferred(name: str) -> Handler:
+    """Like _deferred, for the bot named in the URL (/t/{tenant}/…)."""
+    async def handler(request: web.Request) -> web.StreamResponse:
+        target = STARTUP.handlers.get(f"{request.match_info['tenant']}/{name}")
+        if target is None:
+            if STARTUP.ready:
+                raise web.HTTPNotFound()
+            raise web.HTTPServiceUnavailable(headers={"Retry-After": "5"})
+        return await target(request)
+
+    return handler
+
+
+async def start_server(port: int) -> web.AppRunner:  # FIX-KEEPALIVE
+    app = web.Application()
+    app.router.add_get("/", _keepalive)
+    app.router.add_get("/live", _live)
+    app.router.add_get("/ready", _ready)
+    app.router.add_get("/health", _ready)
+    # all routes are known upfront: aiohttp can not add routes to a running app
+    app.router.add_get("/metrics", _deferred("metrics"))
+    app.router.add_get("/export", _deferred("export"))
+    app.router.add_post("/telegram/{path}", _deferred("webhook"))
+    app.router.add_post("/paypal/ipn", _deferred("ipn"))
+    app.router.add_get("/t/{tenant}/export", _tenant_deferred("export"))
+    app.router.add_post("/t/{tenant}/telegram/{path}", _tenant_deferred("webhook"))
+    app.router.add_post("/t/{tenant}/paypal/ipn", _tenant_deferred("ipn"))
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, "0.0.0.0", port).start()
+    return runner
+
+
+# =========================
+# Main
+# =========================
+
+def _load_bot():
+    # `python bot.py` registers itself as "bot" before calling main(), no second copy
+    return sys.modules.get("bot") or importlib.import_module("bot")
+
+
+def _load_tenants(directory: str):
+    tenants = importlib.import_module("tenants")
+    return tenants, tenants.load_tenants(directory)
+
+
+async def _main_async() -> None:
+    loop = asyncio.get_running_loop()
+    stop = asyncio.Event()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except NotImplementedError:  # Windows
+            pass
+
+    port = int(os.getenv("PORT", "10000"))
+    runner = await start_server(port)
+    STARTUP.mark("http_bound")
+    logger.info("Web server listening on port %d", port)
+    try:
+        # the telegram stack takes most of the cold start; keep /live responsive meanwhile
+        tenants_dir = os.getenv("TENANTS_DIR", "")
+        if tenants_dir:
+            tenants, bots = await asyncio.to_thread(_load_tenants, tenants_dir)
+            STARTUP.mark("import")
+            await tenants.serve_all(bots, stop, STARTUP)
+        else:
+            bot = await asyncio.to_thread(_load_bot)
+            STARTUP.mark("import")
+            await bot.serve(stop, STARTUP)
+    except Exception:
+        logger.exception("Bot failed while %s", STARTUP.state)
+        STARTUP.set_state("failed")
+        raise
+    finally:
+        await runner.cleanup()
+
+
+def main() -> None:
+    setup_logging()
+    asyncio.run(_main_async())
+
+
+if __name__ == "__main__":
+    sys.modules.setdefault("boot", sys.modules["__main__"])  # bot.py reads boot.STARTUP
+    main()
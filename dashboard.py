@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+
+"""
+Admin dashboard: /pending and /applications as pages of one message.
+
+A page is read with FormStore.page() after a cursor, (submitted_at, user_id)
+of the row next to it, so flipping costs one index range scan of page_size + 1
+rows — no matter how many applications there are. The view (status and
+nationality filters, page number, cursor) travels in the callback_data of the
+◀/▶/🔄 buttons, so pages work after a restart and on any replica:
+
+    apps:<status>:<nationality>:<direction><submitted_at ms>.<user_id>:<page>:<total>
+
+direction is ">" (after the cursor), "<" (before it), "=" (from it, refresh)
+or "^" (first page, no cursor). All of it stays under Telegram's 64 bytes.
+"""
+
+import time
+from typing import List, Optional, Sequence, Tuple
+
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+
+from router import number
+from store import Cursor, Form, FormStore, STATUS_PAID, STATUS_PENDING, STATUS_SUBMITTED, submitted_at
+
+PREFIX = "apps:"
+STATUSES: Tuple[Optional[str], ...] = (None, STATUS_SUBMITTED, STATUS_PENDING, STATUS_PAID)
+TITLES = {None: "Applications", STATUS_SUBMITTED: "Awaiting payment",
+          STATUS_PENDING: "Payments to confirm", STATUS_PAID: "Paid applications"}
+
+Page = Tuple[str, InlineKeyboardMarkup]
+
+
+class View:
+    __slots__ = ("status", "nationality", "page", "total")
+
+    def __init__(self, status: Optional[str] = None, nationality: Optional[str] = None,
+                 page: int = 1, total: int = 0) -> None:
+        self.status = status
+        self.nationality = nationality
+        self.page = page
+        self.total = total  # counted when the dashboard was opened or refreshed
+
+    def callback(self, direction: str, cursor: Optional[Cursor], page: int, nationalities: Sequence[str]) -> str:
+        nat = str(nationalities.index(self.nationality)) if self.nationality is not None else ""
+        position = f"{direction}{round(cursor[0] * 1000)}.{cursor[1]}" if cursor is not None else "^"
+        return f"{PREFIX}{STATUSES.index(self.status)}:{nat}:{position}:{page}:{self.total}"
+
+    @classmethod
+    def parse(cls, data: str, nationalities: Sequence[str]) -> Tuple["View", str, Optional[Cursor]]:
+        """View, direction and cursor from callback_data (without PREFIX); ValueError if malformed."""
+        try:
+            status, nat, position, page, total = data.split(":")
+            view = cls(STATUSES[number(status)], nationalities[number(nat)] if nat else None,
+                       number(page), number(total))
+            direction, cursor = position[0], None
+            if direction != "^":
+                ms, uid = position[1:].split(".")
+                cursor = (number(ms) / 1000, number(uid))
+        except (IndexError, ValueError) as e:
+            raise ValueError(f"bad dashboard callback {data!r}") from e
+        if direction not in "^<>=":
+            raise ValueError(f"bad dashboard callback {data!r}")
+        return view, direction, cursor
+
+
+async def load(store: FormStore, view: View, direction: str, cursor: Optional[Cursor],
+         page_size: int) -> Tuple[List[Tuple[int, Form]], bool, bool]:
+    """Rows of the page and whether there are pages before and after it."""
+    if direction == "<":
+        rows = await store.page(view.status, view.nationality, before=cursor, limit=page_size + 1)
+        has_prev = len(rows) > page_size
+        return rows[-page_size:], has_prev, True
+    after = None
+    if cursor is not None:
+        # "=": from the cursor itself, i.e. after the position just below it
+        after = (cursor[0], cursor[1] - 1) if direction == "=" else cursor
+    rows = await store.page(view.status, view.nationality, after=after, limit=page_size + 1)
+    return rows[:page_size], view.page > 1, len(rows) > page_size
+
+
+def render(view: View, rows: List[Tuple[int, Form]], has_prev: bool, has_next: bool,
+           nationalities: Sequence[str]) -> Page:
+    title = TITLES[view.status] + (f" — {view.nationality}" if view.nationality else "")
+    lines = [f"📋 {title}: {view.total} (page {view.page})"]
+    buttons: List[List[InlineKeyboardButton]] = []
+    if not rows:
+        lines.append("Nothing here.")
+    for uid, form in rows:
+        when = time.strftime("%Y-%m-%d %H:%M", time.gmtime(submitted_at(form) or 0))
+        lines.append(f"• {form.get('full_name') or '—'} · {form.get('nationality') or '—'} · {when} UTC · "
+                     f"{form.get('status')} · ID {uid}")
+        if form.get("status") == STATUS_PENDING:
+            label = form.get("full_name") or str(uid)
+            buttons.append([InlineKeyboardButton(f"Mark as paid: {label}", callback_data=f"admin_mark_paid:{uid}")])
+
+    nav = []
+    if rows and has_prev:
+        nav.append(InlineKeyboardButton("◀ Prev", callback_data=view.callback(
+            "<", _cursor(rows[0]), view.page - 1, nationalities)))
+    first = _cursor(rows[0]) if rows else None
+    nav.append(InlineKeyboardButton("🔄", callback_data=view.callback("=", first, view.page, nationalities)))
+    if rows and has_next:
+        nav.append(InlineKeyboardButton("Next ▶", callback_data=view.callback(
+            ">", _cursor(rows[-1]), view.page + 1, nationalities)))
+    buttons.append(nav)
+    return "\n".join(lines), InlineKeyboardMarkup(buttons)
+
+
+def _cursor(row: Tuple[int, Form]) -> Cursor:
+    uid, form = row
+    return submitted_at(form) or 0.0, uid
+
+
+def parse_filters(args: Sequence[str], status: Optional[str] = None) -> Tuple[Optional[str], str]:
+    """/applications [submitted|pending|paid|all] [nationality …] -> (status, nationality text)."""
+    words = list(args)
+    if words and words[0].lower() in ("all", STATUS_SUBMITTED, STATUS_PENDING, STATUS_PAID):
+        word = words.pop(0).lower()
+        status = None if word == "all" else word
+    return status, " ".join(words)
@@ -0,0 +1,222 @@
+# -*- coding: utf-8 -*-
+
+"""
+The SQL database behind the forms, conversation states, payment ledger and
+pending digests (store.py, persistence.py, payments.py, digest.py).
+
+Two backends with the same interface; the SQL is written once, with "?"
+placeholders and SQLite type names:
+
+* PostgresDatabase — DATABASE_URL=postgres://…, what replicas on separate
+  machines share (see sharding.py). Needs asyncpg, an optional dependency.
+* SQLiteDatabase — a local file in WAL mode: a single instance, local runs and
+  tests. WAL relies on memory shared by the processes of one host, so the file
+  can not be shared between machines or over a network filesystem.
+
+open_database() hands out one Database per file or URL in the process, so the
+modules above share its connections; the last close() closes them.
+"""
+
+import abc
+import asyncio
+import re
+import sqlite3
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+from urllib.parse import urlsplit
+
+try:
+    import asyncpg
+except ImportError:  # pragma: no cover - optional dependency
+    asyncpg = None
+
+Row = Tuple[Any, ...]
+Batch = Tuple[str, Sequence[Sequence[Any]]]  # (sql, parameters of every row)
+
+# SQLite type names in the schemas -> PostgreSQL (Telegram ids do not fit in 32 bits)
+_PG_TYPES = [(re.compile(r"\bINTEGER\b"), "BIGINT"), (re.compile(r"\bREAL\b"), "DOUBLE PRECISION"),
+             (re.compile(r"\bBLOB\b"), "BYTEA")]
+
+
+class Database(abc.ABC):
+    """Interface of the database. Every method is a coroutine, none blocks the event loop."""
+
+    url = ""
+    name = ""  # for logs: the url without credentials
+
+    def __init__(self) -> None:
+        self._users = 0
+
+    @abc.abstractmethod
+    async def script(self, ddl: str) -> None:
+        """Run schema statements (CREATE TABLE/INDEX IF NOT EXISTS …)."""
+
+    @abc.abstractmethod
+    async def columns(self, table: str) -> List[str]:
+        """Names of the columns of a table."""
+
+    @abc.abstractmethod
+    async def execute(self, sql: str, params: Sequence[Any] = ()) -> int:
+        """One statement; the number of rows it changed."""
+
+    @abc.abstractmethod
+    async def fetch(self, sql: str, params: Sequence[Any] = ()) -> List[Row]:
+        """Rows of a query."""
+
+    @abc.abstractmethod
+    async def write(self, batches: Iterable[Batch]) -> None:
+        """executemany() of every batch, all in one transaction."""
+
+    @abc.abstractmethod
+    async def _close(self) -> None:
+        """Close the connections."""
+
+    async def close(self) -> None:
+        self._users -= 1
+        if self._users <= 0:
+            _OPEN.pop(self.url, None)
+            await self._close()
+
+
+class SQLiteDatabase(Database):
+    """A write connection (transactions, one at a time) and a read connection: in
+    WAL mode reads never wait for a transaction, not even for one that waits
+    busy_timeout for the write lock held by another process."""
+
+    def __init__(self, path: str, busy_timeout: float = 5.0) -> None:
+        super().__init__()
+        self.url = self.name = path
+        self._write_lock = threading.Lock()
+        self._read_lock = threading.Lock()
+        self._writer = self._connect(path, busy_timeout)
+        self._writer.execute("PRAGMA journal_mode=WAL")
+        self._writer.execute("PRAGMA synchronous=NORMAL")
+        self._reader = self._connect(path, busy_timeout)
+
+    @staticmethod
+    def _connect(path: str, busy_timeout: float) -> sqlite3.Connection:
+        return sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=busy_timeout)
+
+    def _script(self, ddl: str) -> None:
+        with self._write_lock:
+            self._writer.executescript(ddl)
+
+    def _execute(self, sql: str, params: Sequence[Any]) -> int:
+        with self._write_lock:
+            return self._writer.execute(sql, params).rowcount
+
+    def _fetch(self, sql: str, params: Sequence[Any]) -> List[Row]:
+        with self._read_lock:
+            return self._reader.execute(sql, params).fetchall()
+
+    def _write(self, batches: Iterable[Batch]) -> None:
+        with self._write_lock:
+            self._writer.execute("BEGIN")
+            try:
+                for sql, rows in batches:
+                    self._writer.executemany(sql, rows)
+                self._writer.execute("COMMIT")
+            except Exception:
+                self._writer.execute("ROLLBACK")
+                raise
+
+    async def script(self, ddl: str) -> None:
+        await asyncio.to_thread(self._script, ddl)
+
+    async def columns(self, table: str) -> List[str]:
+        return [row[1] for row in await self.fetch(f"PRAGMA table_info({table})")]
+
+    async def execute(self, sql: str, params: Sequence[Any] = ()) -> int:
+        return await asyncio.to_thread(self._execute, sql, list(params))
+
+    async def fetch(self, sql: str, params: Sequence[Any] = ()) -> List[Row]:
+        return await asyncio.to_thread(self._fetch, sql, list(params))
+
+    async def write(self, batches: Iterable[Batch]) -> None:
+        await asyncio.to_thread(self._write, list(batches))
+
+    async def _close(self) -> None:
+        with self._write_lock:
+            self._writer.close()
+        with self._read_lock:
+            self._reader.close()
+
+
+class PostgresDatabase(Database):
+    """A pool of asyncpg connections, opened on first use."""
+
+    def __init__(self, url: str, pool_size: int = 10) -> None:
+        if asyncpg is None:
+            raise RuntimeError("DATABASE_URL needs asyncpg (pip install asyncpg)")
+        super().__init__()
+        self.url = url
+        parts = urlsplit(url)
+        self.name = f"{parts.hostname}{parts.path}"
+        self.pool_size = pool_size
+        self._pool: Optional["asyncpg.Pool"] = None
+        self._opening = asyncio.Lock()
+        self._queries: Dict[str, str] = {}  # "?" -> "$n", per statement text
+
+    async def _connection_pool(self) -> "asyncpg.Pool":
+        async with self._opening:
+            if self._pool is None:
+                self._pool = await asyncpg.create_pool(self.url, min_size=1, max_size=self.pool_size)
+        return self._pool
+
+    def _sql(self, sql: str) -> str:
+        query = self._queries.get(sql)
+        if query is None:
+            parts = sql.split("?")  # the statements here have no "?" in literals
+            query = parts[0] + "".join(f"${i}{part}" for i, part in enumerate(parts[1:], 1))
+            self._queries[sql] = query
+        return query
+
+    async def script(self, ddl: str) -> None:
+        for pattern, name in _PG_TYPES:
+            ddl = pattern.sub(name, ddl)
+        pool = await self._connection_pool()
+        await pool.execute(ddl)
+
+    async def columns(self, table: str) -> List[str]:
+        rows = await self.fetch("SELECT column_name FROM information_schema.columns "
+                                "WHERE table_schema = current_schema() AND table_name = ?", (table,))
+        return [row[0] for row in rows]
+
+    async def execute(self, sql: str, params: Sequence[Any] = ()) -> int:
+        pool = await self._connection_pool()
+        status = await pool.execute(self._sql(sql), *params)  # e.g. "UPDATE 1", "INSERT 0 1"
+        count = status.rsplit(" ", 1)[-1]
+        return int(count) if count.isdigit() else 0
+
+    async def fetch(self, sql: str, params: Sequence[Any] = ()) -> List[Row]:
+        pool = await self._connection_pool()
+        return [tuple(record) for record in await pool.fetch(self._sql(sql), *params)]
+
+    async def write(self, batches: Iterable[Batch]) -> None:
+        pool = await self._connection_pool()
+        async with pool.acquire() as connection:
+            async with connection.transaction():
+                for sql, rows in batches:
+                    if rows:
+                        await connection.executemany(self._sql(sql), rows)
+
+    async def _close(self) -> None:
+        if self._pool is not None:
+            await self._pool.close()
+            self._pool = None
+
+
+_OPEN: Dict[str, Database] = {}
+
+
+def is_url(target: str) -> bool:
+    return target.startswith(("postgres://", "postgresql://"))
+
+
+def open_database(target: str) -> Database:
+    """The Database of a postgres:// URL or an SQLite file path; call close() when done."""
+    database = _OPEN.get(target)
+    if database is None:
+        database = _OPEN[target] = PostgresDatabase(target) if is_url(target) else SQLiteDatabase(target)
+    database._users += 1
+    return database
@@ -0,0 +1,235 @@
+# -*- coding: utf-8 -*-
+
+"""
+Coalesced "payment pending" notices for the admin chat.
+
+Every "✅ I paid" press used to send its own admin message, and users press it
+more than once. Notices are now collected per user for `window` seconds and
+sent as one digest: the pending applications one page at a time, a "Mark as
+paid" button per application and ◀/▶ buttons that edit the same message to
+another page. A user already notified within `renotify_after` seconds is not
+repeated. The admin chat is limited to about one message per second (see
+scheduler.py), so under load this is what keeps the notices timely.
+
+Sent digests are kept by message id (the last `keep` ones) in a DigestStore:
+in memory for one process, or DatabaseDigestStore next to the forms, so the
+admin can page a digest on any replica (and after a restart). Paging a digest
+that is no longer kept reports it as expired.
+"""
+
+import asyncio
+import json
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup, Message
+from telegram.constants import MessageLimit
+
+from database import Database
+
+logger = logging.getLogger(__name__)
+
+Entry = Tuple[int, str, str]  # (user_id, button label, details)
+Page = Tuple[str, InlineKeyboardMarkup]
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS pending_digests (
+    message_id INTEGER PRIMARY KEY,
+    entries    TEXT NOT NULL,
+    shown      INTEGER NOT NULL DEFAULT 0,
+    sent_at    REAL NOT NULL
+);
+"""
+
+
+# =========================
+# Sent digests
+# =========================
+
+class DigestStore:
+    """Sent digests in memory: message_id -> (entries, page on screen), the last `keep`."""
+
+    def __init__(self, keep: int = 100) -> None:
+        self.keep = keep
+        self._digests: "OrderedDict[int, Tuple[List[Entry], int]]" = OrderedDict()
+
+    async def save(self, message_id: int, entries: List[Entry]) -> None:
+        self._digests[message_id] = (entries, 0)
+        while len(self._digests) > self.keep:
+            self._digests.popitem(last=False)
+
+    async def load(self, message_id: int) -> Optional[Tuple[List[Entry], int]]:
+        return self._digests.get(message_id)
+
+    async def show(self, message_id: int, page: int) -> None:
+        if message_id in self._digests:
+            self._digests[message_id] = (self._digests[message_id][0], page)
+
+    async def close(self) -> None:
+        pass
+
+
+class DatabaseDigestStore(DigestStore):
+    """Sent digests in the database (next to the forms, shared by replicas)."""
+
+    def __init__(self, database: Database, keep: int = 100) -> None:
+        super().__init__(keep)
+        self.db = database
+        self._created = False
+
+    async def _create(self) -> Database:
+        if not self._created:  # on first use
+            await self.db.script(_SCHEMA)
+            self._created = True
+        return self.db
+
+    async def save(self, message_id: int, entries: List[Entry]) -> None:
+        db = await self._create()
+        await db.write([
+            ("INSERT INTO pending_digests (message_id, entries, shown, sent_at) VALUES (?, ?, 0, ?) "
+             "ON CONFLICT(message_id) DO UPDATE SET entries = excluded.entries, shown = 0, "
+             "sent_at = excluded.sent_at", [(message_id, json.dumps(entries), time.time())]),
+            ("DELETE FROM pending_digests WHERE message_id NOT IN "
+             "(SELECT message_id FROM pending_digests ORDER BY sent_at DESC LIMIT ?)", [(self.keep,)]),
+        ])
+
+    async def load(self, message_id: int) -> Optional[Tuple[List[Entry], int]]:
+        db = await self._create()
+        rows = await db.fetch("SELECT entries, shown FROM pending_digests WHERE message_id = ?", (message_id,))
+        if not rows:
+            return None
+        entries, shown = rows[0]
+        return [tuple(entry) for entry in json.loads(entries)], shown
+
+    async def show(self, message_id: int, page: int) -> None:
+        db = await self._create()
+        await db.execute("UPDATE pending_digests SET shown = ? WHERE message_id = ?", (page, message_id))
+
+    async def close(self) -> None:
+        await self.db.close()
+
+
+# =========================
+# Digest
+# =========================
+
+class PendingDigest:
+    def __init__(self, send: Callable[[str, InlineKeyboardMarkup], Awaitable[Message]],
+                 window: float = 5.0, page_size: int = 5, renotify_after: float = 3600.0,
+                 keep: int = 100, is_done: Optional[Callable[[int], Awaitable[bool]]] = None,
+                 store: Optional[DigestStore] = None) -> None:
+        self.send = send
+        self.window = window
+        self.page_size = page_size
+        self.renotify_after = renotify_after
+        # is_done(user_id): the payment was confirmed since (no button, marked ✅)
+        self.is_done = is_done
+        self.store = store if store is not None else DigestStore(keep)
+
+        self._batch: Dict[int, Entry] = {}  # user_id -> entry, the window being collected
+        self._notified: Dict[int, float] = {}  # user_id -> last digest (monotonic)
+        self._timer: Optional[asyncio.Task] = None
+        self.coalesced = 0  # notices that did not become a message of their own
+        self.sent = 0
+
+    def add(self, user_id: int, label: str, details: str) -> bool:
+        """Queue a notice; False if it repeats one already queued or recently sent."""
+        if user_id in self._batch:
+            self._batch[user_id] = (user_id, label, details)  # the latest details win
+            self.coalesced += 1
+            return False
+        notified = self._notified.get(user_id)
+        if notified is not None and time.monotonic() - notified < self.renotify_after:
+            self.coalesced += 1
+            return False
+        if self._batch:
+            self.coalesced += 1  # joins a digest that is already waiting
+        self._batch[user_id] = (user_id, label, details)
+        if self._timer is None:
+            self._timer = asyncio.create_task(self._flush_later(), name="pending-digest")
+        return True
+
+    async def _flush_later(self) -> None:
+        await asyncio.sleep(self.window)
+        self._timer = None
+        await self.flush()
+
+    async def flush(self) -> None:
+        if not self._batch:
+            return
+        entries, self._batch = list(self._batch.values()), {}
+        now = time.monotonic()
+        for user_id, _, _ in entries:
+            self._notified[user_id] = now
+        # users not repeated for renotify_after can be dropped, keeps _notified bounded
+        cutoff = now - self.renotify_after
+        self._notified = {uid: t for uid, t in self._notified.items() if t >= cutoff}
+
+        text, markup = await self.render(entries, 0)
+        try:
+            message = await self.send(text, markup)
+        except Exception as e:
+            logger.warning("Failed to send the pending payments digest (%d users): %s", len(entries), e)
+            for user_id, _, _ in entries:
+                self._notified.pop(user_id, None)  # the next press notifies again
+            return
+        self.sent += 1
+        try:
+            await self.store.save(message.message_id, entries)
+        except Exception as e:
+            logger.warning("Failed to keep the pending payments digest for paging: %s", e)
+
+    # --- pages ---
+
+    def pages(self, entries: List[Entry]) -> int:
+        return max(1, -(-len(entries) // self.page_size))
+
+    async def render(self, entries: List[Entry], page: int) -> Page:
+        pages = self.pages(entries)
+        page = min(max(page, 0), pages - 1)
+        shown = entries[page * self.page_size:(page + 1) * self.page_size]
+        heading = f"⏳ Payment pending ({len(entries)})" if len(entries) > 1 else "⏳ Payment pending"
+        if pages > 1:
+            heading += f" — page {page + 1}/{pages}"
+        blocks, rows = [heading], []
+        for user_id, label, details in shown:
+            if self.is_done is not None and await self.is_done(user_id):
+                blocks.append(f"✅ confirmed\n{details}")
+                continue
+            blocks.append(details)
+            rows.append([InlineKeyboardButton(f"Mark as paid: {label}", callback_data=f"admin_mark_paid:{user_id}")])
+        nav = []
+        if page > 0:
+            nav.append(InlineKeyboardButton("◀ Prev", callback_data=f"pending_page:{page - 1}"))
+        if page < pages - 1:
+            nav.append(InlineKeyboardButton("Next ▶", callback_data=f"pending_page:{page + 1}"))
+        if nav:
+            rows.append(nav)
+        text = "\n\n".join(blocks)
+        if len(text) > MessageLimit.MAX_TEXT_LENGTH:
+            text = text[:MessageLimit.MAX_TEXT_LENGTH - 1] + "…"
+        return text, InlineKeyboardMarkup(rows)
+
+    async def page(self, message_id: int, page: Optional[int] = None) -> Optional[Page]:
+        """Page of the digest sent as message_id (None — the one on screen); None if it is no longer known."""
+        found = await self.store.load(message_id)
+        if found is None:
+            return None
+        entries, shown = found
+        page = min(max(shown if page is None else page, 0), self.pages(entries) - 1)
+        if page != shown:
+            await self.store.show(message_id, page)
+        return await self.render(entries, page)
+
+    async def close(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            try:
+                await self._timer
+            except asyncio.CancelledError:
+                pass
+            self._timer = None
+        await self.flush()
+        await self.store.close()
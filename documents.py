@@ -0,0 +1,243 @@
+# -*- coding: utf-8 -*-
+
+"""
+Document pipeline for uploaded passport scans and photos.
+
+Every upload is downloaded once and keyed by its file_unique_id, so the same
+file sent twice (or by two replicas) is processed once. Images are rotated
+upright according to their EXIF orientation, downscaled to a page and a
+compressed thumbnail. At confirmation time the admin gets one combined PDF per
+application instead of raw multi-megabyte phone photos; after that (or when
+the form is abandoned) discard() deletes the application's files.
+
+Decoding and encoding images is CPU-bound, so it runs in a ProcessPoolExecutor;
+the event loop only downloads and waits (file reads and writes go to a thread);
+the pool is shared by all pipelines in the process. Pillow is optional: without
+it enabled is False and the bot sends the original files as before.
+"""
+
+import asyncio
+import hashlib
+import io
+import json
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import ExitStack
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # pragma: no cover - optional dependency
+    Image = ImageOps = None
+
+logger = logging.getLogger(__name__)
+
+PAGE_SIZE = 2000   # px, longest side of a PDF page
+THUMB_SIZE = 320   # px, Telegram limit for document thumbnails
+PAGE_QUALITY = 85
+THUMB_QUALITY = 70
+
+Upload = Tuple[str, str, str]  # (kind, file_id, file_unique_id), see bot.get_upload()
+
+
+# =========================
+# Worker side (runs in the process pool, keep it free of bot imports)
+# =========================
+
+def _init_worker() -> None:
+    # the bot's event loop goes first when the CPU is busy with images
+    try:
+        os.nice(10)
+    except (AttributeError, OSError):
+        pass
+
+
+def normalize_upload(data: bytes, out_dir: str, key: str) -> Dict[str, Any]:
+    """Hash the upload; for images also write an upright page and a thumbnail (JPEG)."""
+    meta: Dict[str, Any] = {"sha256": hashlib.sha256(data).hexdigest(), "size": len(data), "image": False}
+    try:
+        image = Image.open(io.BytesIO(data))
+        image.draft("RGB", (PAGE_SIZE, PAGE_SIZE))  # JPEG: decode at reduced scale, much cheaper
+        image.load()
+    except Exception:
+        return meta  # PDF or another non-image document, sent as is
+
+    image = ImageOps.exif_transpose(image).convert("RGB")
+    page = image.copy()
+    page.thumbnail((PAGE_SIZE, PAGE_SIZE))
+    page.save(os.path.join(out_dir, f"{key}.page.jpg"), "JPEG", quality=PAGE_QUALITY, optimize=True)
+    image.thumbnail((THUMB_SIZE, THUMB_SIZE))
+    image.save(os.path.join(out_dir, f"{key}.thumb.jpg"), "JPEG", quality=THUMB_QUALITY, optimize=True)
+    meta.update(image=True, width=page.width, height=page.height)
+    return meta
+
+
+def combine_pdf(pages: Sequence[str]) -> bytes:
+    """One PDF with a page per image."""
+    with ExitStack() as stack:  # closes the files, also when one of them fails
+        images = [stack.enter_context(Image.open(path)) for path in pages]
+        out = io.BytesIO()
+        images[0].save(out, "PDF", save_all=True, append_images=images[1:], resolution=150.0)
+    return out.getvalue()
+
+
+def _read_meta(path: str) -> Optional[Dict[str, Any]]:
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def _write_meta(path: str, meta: Dict[str, Any]) -> None:
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+    os.replace(tmp, path)  # written last: marks the upload as done
+
+
+def _read_bytes(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def _remove(paths: Sequence[str]) -> None:
+    for path in paths:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+# =========================
+# Event loop side
+# =========================
+
+# One pool per process: several bots hosted together (tenants.py) share the
+# workers instead of starting DOCUMENT_WORKERS processes each
+_POOL: Optional[ProcessPoolExecutor] = None
+_POOL_USERS = 0
+
+
+def _acquire_pool(max_workers: int) -> ProcessPoolExecutor:
+    global _POOL, _POOL_USERS
+    if _POOL is None:
+        _POOL = ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker)
+    _POOL_USERS += 1
+    return _POOL
+
+
+def _release_pool() -> None:
+    global _POOL, _POOL_USERS
+    _POOL_USERS -= 1
+    if _POOL_USERS <= 0 and _POOL is not None:
+        _POOL.shutdown(wait=False, cancel_futures=True)
+        _POOL, _POOL_USERS = None, 0
+
+
+class DocumentPipeline:
+    def __init__(self, directory: str, max_workers: int = 2, observer=None) -> None:
+        self.directory = directory
+        self.max_workers = max_workers
+        # observer(stage, seconds) for download / normalize / pdf
+        self.observer = observer
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._inflight: Dict[str, "asyncio.Future[Dict[str, Any]]"] = {}
+
+    @property
+    def enabled(self) -> bool:
+        return Image is not None
+
+    def start(self) -> None:
+        if not self.enabled:
+            logger.warning("Pillow is not installed, uploads are sent to the admin unprocessed")
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        if self._executor is None:
+            self._executor = _acquire_pool(self.max_workers)
+
+    async def close(self) -> None:
+        if self._executor is not None:
+            self._executor = None
+            _release_pool()
+
+    def _path(self, key: str, suffix: str) -> str:
+        return os.path.join(self.directory, f"{key}.{suffix}")
+
+    def _observe(self, stage: str, started: float) -> None:
+        if self.observer is not None:
+            self.observer(stage, time.perf_counter() - started)
+
+    async def _run(self, stage: str, fn, *args):
+        if self._executor is None:
+            self.start()
+        started = time.perf_counter()
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+        finally:
+            self._observe(stage, started)
+
+    # --- per upload ---
+
+    async def ensure(self, bot, upload: Upload) -> Dict[str, Any]:
+        """Metadata of a processed upload; downloads and processes it unless done already."""
+        key = upload[2]
+        meta = await asyncio.to_thread(_read_meta, self._path(key, "json"))
+        if meta is not None:
+            return meta
+        # concurrent callers (prefetch + admin confirmation) share one download
+        fut = self._inflight.get(key)
+        if fut is None:
+            fut = self._inflight[key] = asyncio.ensure_future(self._process(bot, upload))
+            fut.add_done_callback(lambda _: self._inflight.pop(key, None))
+        return await asyncio.shield(fut)
+
+    async def _process(self, bot, upload: Upload) -> Dict[str, Any]:
+        kind, file_id, key = upload
+        started = time.perf_counter()
+        data = bytes(await (await bot.get_file(file_id)).download_as_bytearray())
+        self._observe("download", started)
+
+        meta = await self._run("normalize", normalize_upload, data, self.directory, key)
+        meta.update(kind=kind, file_id=file_id)
+        await asyncio.to_thread(_write_meta, self._path(key, "json"), meta)
+        return meta
+
+    async def prefetch(self, bot, upload: Upload) -> None:
+        """Process an upload in the background right after the user sent it."""
+        if not self.enabled:
+            return
+        try:
+            await self.ensure(bot, upload)
+        except Exception as e:
+            logger.warning("Preprocessing upload %s failed: %s", upload[2], e)
+
+    # --- per application ---
+
+    async def application_pdf(self, bot, uploads: List[Upload]) -> Tuple[Optional[bytes], Optional[bytes], List[Upload]]:
+        """(combined PDF of the image uploads, thumbnail JPEG, uploads that are not images)."""
+        metas = await asyncio.gather(*(self.ensure(bot, upload) for upload in uploads))
+        pages, others = [], []
+        for upload, meta in zip(uploads, metas):
+            if meta.get("image"):
+                pages.append(self._path(upload[2], "page.jpg"))
+            else:
+                others.append(upload)
+        if not pages:
+            return None, None, others
+
+        pdf = await self._run("pdf", combine_pdf, pages)
+        # the last image is the digital photo if there is one — the most recognisable thumbnail
+        thumbnail = await asyncio.to_thread(_read_bytes, pages[-1].replace(".page.jpg", ".thumb.jpg"))
+        return pdf, thumbnail, others
+
+    async def discard(self, uploads: List[Upload]) -> None:
+        """Delete the processed files of an application (sent to the admin or abandoned)."""
+        paths = [self._path(upload[2], suffix)
+                 for upload in uploads for suffix in ("json", "page.jpg", "thumb.jpg")]
+        try:
+            await asyncio.to_thread(_remove, paths)
+        except OSError as e:
+            logger.warning("Could not delete processed uploads: %s", e)
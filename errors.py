@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+
+"""
+Windowed, deduplicated error reports for the admin chat.
+
+Exceptions are grouped by type and location (innermost frame of our own code).
+The first occurrence of a kind is reported at once; repeats are only counted
+and sent as one digest per window with counts and a sample traceback.
+"""
+
+import asyncio
+import logging
+import os
+import time
+import traceback
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+from telegram.constants import MessageLimit
+
+logger = logging.getLogger(__name__)
+
+Fingerprint = Tuple[str, str]  # (exception type, "file.py:line in function")
+
+_PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def fingerprint(exc: BaseException) -> Fingerprint:
+    frames = traceback.extract_tb(exc.__traceback__) if exc.__traceback__ else []
+    ours = [f for f in frames if os.path.abspath(f.filename).startswith(_PROJECT_DIR)
+            and "site-packages" not in f.filename]
+    frame = (ours or frames or [None])[-1]
+    if frame is None:
+        return type(exc).__name__, "?"
+    return type(exc).__name__, f"{os.path.basename(frame.filename)}:{frame.lineno} in {frame.name}"
+
+
+class _Group:
+    __slots__ = ("count", "message", "sample", "last_seen")
+
+    def __init__(self, message: str, sample: str) -> None:
+        self.count = 0
+        self.message = message
+        self.sample = sample
+        self.last_seen = time.monotonic()
+
+
+class ErrorDigest:
+    def __init__(self, window: float = 300.0, forget_after: float = 24 * 3600.0) -> None:
+        self.window = window
+        self.forget_after = forget_after  # a kind not seen for this long is "new" again
+        self._known: Dict[Fingerprint, float] = {}  # fingerprint -> last seen (monotonic)
+        self._repeats: Dict[Fingerprint, _Group] = {}
+        self._send: Optional[Callable[[str], Awaitable[object]]] = None
+        self._task: Optional[asyncio.Task] = None
+        self.suppressed = 0
+
+    def record(self, exc: BaseException) -> Optional[str]:
+        """Count the exception; returns the alert text if this kind is new, else None."""
+        key = fingerprint(exc)
+        now = time.monotonic()
+        seen = self._known.get(key)
+        self._known[key] = now
+        if seen is None or now - seen > self.forget_after:
+            return _truncate(f"⚠️ New error: {key[0]} at {key[1]}\n{exc}")
+
+        self.suppressed += 1
+        group = self._repeats.get(key)
+        if group is None:
+            # the end of a traceback is the informative part
+            sample = "".join(traceback.format_exception(type(exc), exc, exc.__traceback__))[-1500:]
+            group = self._repeats[key] = _Group(str(exc), sample)
+        group.count += 1
+        group.last_seen = now
+        return None
+
+    def digest(self) -> Optional[str]:
+        """Text of the repeats collected in the current window (and reset it)."""
+        if not self._repeats:
+            return None
+        groups = sorted(self._repeats.items(), key=lambda kv: kv[1].count, reverse=True)
+        self._repeats = {}
+        lines = [f"⚠️ Repeated errors, last {int(self.window // 60) or 1} min:"]
+        for (name, where), group in groups:
+            lines.append(f"• {group.count}× {name} at {where}: {group.message[:200]}")
+        lines += ["", "Sample traceback:", groups[0][1].sample]
+
+        # forget kinds that did not happen for a long time, keeps _known bounded
+        cutoff = time.monotonic() - self.forget_after
+        self._known = {k: t for k, t in self._known.items() if t >= cutoff}
+        return _truncate("\n".join(lines))
+
+    async def _loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.window)
+            await self.flush()
+
+    async def flush(self) -> None:
+        text = self.digest()
+        if text and self._send is not None:
+            try:
+                await self._send(text)
+            except Exception as e:
+                logger.warning("Failed to send error digest: %s", e)
+
+    async def start(self, send: Callable[[str], Awaitable[object]]) -> None:
+        self._send = send
+        if self._task is None:
+            self._task = asyncio.create_task(self._loop(), name="error-digest")
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+
+def _truncate(text: str) -> str:
+    if len(text) <= MessageLimit.MAX_TEXT_LENGTH:
+        return text
+    return text[:MessageLimit.MAX_TEXT_LENGTH - 1] + "…"
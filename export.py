@@ -0,0 +1,221 @@
+# -*- coding: utf-8 -*-
+
+"""
+Streaming export of applications: a ZIP with the form records (CSV or JSONL)
+and, optionally, the uploaded documents.
+
+The archive is produced incrementally: records are read from the store in
+batches, documents are downloaded by a few concurrent workers through a small
+bounded queue, and every finished entry is handed to `write` right away. Memory
+use depends on the concurrency, not on the number of applications.
+"""
+
+import asyncio
+import csv
+import io
+import json
+import logging
+import os
+import time
+import zipfile
+from datetime import datetime, timezone
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from store import FormStore
+
+logger = logging.getLogger(__name__)
+
+CSV_FIELDS = [
+    "user_id", "status", "full_name", "dob", "nationality", "passport_number", "phone", "email",
+    "passport_file_id", "photo_file_id", "submitted_at", "updated_at",
+]
+DOCUMENTS = (("passport", "passport"), ("photo", "photo"))  # (form prefix, file name)
+
+
+class ExportOptions:
+    __slots__ = ("statuses", "since", "until", "fmt", "documents")
+
+    def __init__(self, statuses: Optional[List[str]] = None, since: Optional[float] = None,
+                 until: Optional[float] = None, fmt: str = "csv", documents: bool = True) -> None:
+        if fmt not in ("csv", "jsonl"):
+            raise ValueError("format must be csv or jsonl")
+        self.statuses = statuses
+        self.since = since
+        self.until = until
+        self.fmt = fmt
+        self.documents = documents
+
+    @classmethod
+    def parse(cls, params: Dict[str, str]) -> "ExportOptions":
+        """From key=value pairs: status=paid,pending since=2026-01-01 until=2026-02-01 format=jsonl docs=no.
+
+        Raises ValueError with a message for the user.
+        """
+        unknown = set(params) - {"status", "since", "until", "format", "docs"}
+        if unknown:
+            raise ValueError(f"unknown option(s): {', '.join(sorted(unknown))}")
+        statuses = [s for s in params.get("status", "").split(",") if s] or None
+        return cls(
+            statuses=statuses,
+            since=_parse_date(params.get("since")),
+            until=_parse_date(params.get("until")),
+            fmt=params.get("format", "csv"),
+            documents=params.get("docs", "yes").lower() not in ("0", "no", "false"),
+        )
+
+    def describe(self) -> str:
+        parts = [f"status={','.join(self.statuses) if self.statuses else 'all'}"]
+        if self.since is not None:
+            parts.append(f"since={_format_date(self.since)}")
+        if self.until is not None:
+            parts.append(f"until={_format_date(self.until)}")
+        parts.append(f"format={self.fmt}")
+        parts.append(f"docs={'yes' if self.documents else 'no'}")
+        return " ".join(parts)
+
+
+def _parse_date(value: Optional[str]) -> Optional[float]:
+    if not value:
+        return None
+    try:
+        return datetime.strptime(value, "%Y-%m-%d").replace(tzinfo=timezone.utc).timestamp()
+    except ValueError:
+        raise ValueError(f"bad date {value!r}, expected YYYY-MM-DD") from None
+
+
+def _format_date(ts: float) -> str:
+    return datetime.fromtimestamp(ts, timezone.utc).strftime("%Y-%m-%d")
+
+
+class _Sink(io.RawIOBase):
+    """Write-only, unseekable file for ZipFile; collects output until drained."""
+
+    def __init__(self) -> None:
+        super().__init__()
+        self._chunks: List[bytes] = []
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+class ExportStats:
+    __slots__ = ("forms", "documents", "failed", "bytes")
+
+    def __init__(self) -> None:
+        self.forms = 0
+        self.documents = 0
+        self.failed = 0
+        self.bytes = 0
+
+
+def _records(store: FormStore, options: ExportOptions) -> AsyncIterator[Tuple[int, Dict[str, Any]]]:
+    return store.iter_forms(options.statuses, options.since, options.until)
+
+
+def _extension(file_path: Optional[str], kind: Optional[str]) -> str:
+    ext = os.path.splitext(file_path or "")[1].lower()
+    if ext:
+        return ext
+    return ".jpg" if kind == "photo" else ".bin"
+
+
+async def _download(bot, file_id: str) -> Tuple[bytes, str]:
+    file = await bot.get_file(file_id)
+    return bytes(await file.download_as_bytearray()), file.file_path or ""
+
+
+async def export_zip(store: FormStore, bot, options: ExportOptions,
+                     write: Callable[[bytes], Awaitable[Any]], concurrency: int = 8) -> ExportStats:
+    """Stream the archive to write(); documents are fetched with at most `concurrency` downloads."""
+    stats = ExportStats()
+    sink = _Sink()
+
+    async def flush() -> None:
+        data = sink.drain()
+        if data:
+            stats.bytes += len(data)
+            await write(data)
+
+    await store.flush()  # unflushed forms are not visible to iter_forms()
+    with zipfile.ZipFile(sink, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+        # 1) records, one entry written row by row
+        with zf.open(f"applications.{options.fmt}", "w", force_zip64=True) as entry:
+            text = io.TextIOWrapper(entry, encoding="utf-8", newline="")
+            writer = csv.DictWriter(text, CSV_FIELDS, extrasaction="ignore") if options.fmt == "csv" else None
+            if writer is not None:
+                writer.writeheader()
+            async for uid, form in _records(store, options):
+                row = {"user_id": uid, **form}
+                if writer is not None:
+                    writer.writerow(row)
+                else:
+                    text.write(json.dumps(row, ensure_ascii=False) + "\n")
+                stats.forms += 1
+                if stats.forms % 200 == 0:
+                    text.flush()
+                    await flush()
+            text.flush()
+            text.detach()
+        await flush()
+
+        # 2) documents: workers download, this task writes entries as they arrive
+        if options.documents:
+            jobs: "asyncio.Queue[Optional[Tuple[str, str, Optional[str]]]]" = asyncio.Queue(concurrency * 2)
+            done: "asyncio.Queue[Optional[Tuple[str, Optional[bytes]]]]" = asyncio.Queue(concurrency)
+
+            async def produce() -> None:
+                try:
+                    async for uid, form in _records(store, options):
+                        for prefix, name in DOCUMENTS:
+                            file_id = form.get(f"{prefix}_file_id")
+                            if file_id:
+                                await jobs.put((f"documents/{uid}/{name}", file_id, form.get(f"{prefix}_file_kind")))
+                finally:
+                    for _ in range(concurrency):
+                        await jobs.put(None)
+
+            async def fetch() -> None:
+                while (job := await jobs.get()) is not None:
+                    path, file_id, kind = job
+                    try:
+                        data, file_path = await _download(bot, file_id)
+                        await done.put((path + _extension(file_path, kind), data))
+                    except Exception as e:
+                        logger.warning("Export: could not download %s: %s", path, e)
+                        await done.put((path, None))
+                await done.put(None)
+
+            tasks = [asyncio.create_task(produce())] + [asyncio.create_task(fetch()) for _ in range(concurrency)]
+            try:
+                finished = 0
+                while finished < concurrency:
+                    item = await done.get()
+                    if item is None:
+                        finished += 1
+                        continue
+                    path, data = item
+                    if data is None:
+                        stats.failed += 1
+                        continue
+                    # photos and PDFs are compressed already
+                    zf.writestr(zipfile.ZipInfo(path, time.gmtime()[:6]), data, compress_type=zipfile.ZIP_STORED)
+                    stats.documents += 1
+                    await flush()
+            finally:
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+
+        zf.writestr("README.txt", f"Exported {stats.forms} applications, {stats.documents} documents "
+                                  f"({stats.failed} failed).\nFilter: {options.describe()}\n")
+    await flush()  # central directory
+    return stats
@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+
+"""
+Concurrent update processing with per-user ordering lanes.
+
+Updates of different users are processed in parallel (up to max_concurrent_updates),
+updates of the same user go one by one in arrival order. ConversationHandler relies
+on that ordering, so form_conv stays correct with concurrent_updates enabled.
+
+An update waits for its user's lane first and only then takes one of the
+max_concurrent_updates slots: updates queued behind the same user's earlier ones
+(a photo album, a burst of button presses) hold no slot, so one busy user can
+not stall everyone else.
+"""
+
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Dict, Optional, Set
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+from tracing import NULL_SPAN, Tracer
+
+logger = logging.getLogger(__name__)
+
+
+class _Lane:
+    __slots__ = ("lock", "pending")
+
+    def __init__(self) -> None:
+        self.lock = asyncio.Lock()
+        self.pending = 0  # updates waiting in or running on this lane
+
+
+def lane_key(update: object) -> Optional[int]:
+    """User the update belongs to (chat for channel posts); None — no ordering needed."""
+    if not isinstance(update, Update):
+        return None
+    if update.effective_user:
+        return update.effective_user.id
+    if update.effective_chat:
+        return update.effective_chat.id
+    return None
+
+
+class UserLaneUpdateProcessor(BaseUpdateProcessor):
+    """Runs updates concurrently, but sequentially per user.
+
+    lane_depth bounds how many updates of one user may be queued at once; extra
+    updates (a user hammering buttons) are dropped. Queued updates hold no
+    concurrency slot, only the one running per lane does.
+    """
+
+    def __init__(self, max_concurrent_updates: int, lane_depth: int = 16, tracer: Optional[Tracer] = None):
+        super().__init__(max_concurrent_updates)
+        if lane_depth < 1:
+            raise ValueError("`lane_depth` must be a positive integer!")
+        self.lane_depth = lane_depth
+        # the "dispatch" span is the root of an update's trace (see tracing.py)
+        self.tracer = tracer
+        self._lanes: Dict[int, _Lane] = {}
+        self.dropped = 0
+        self.in_flight = 0  # updates being processed (incl. waiting for their lane)
+        self._tasks: Set[asyncio.Task] = set()  # the tasks running them, for cancel()
+
+    @property
+    def active_lanes(self) -> int:
+        return len(self._lanes)
+
+    async def process_update(self, update: object, coroutine: "Awaitable[Any]") -> None:  # type: ignore[misc]
+        # replaces BaseUpdateProcessor.process_update, which takes the semaphore before anything else
+        self.in_flight += 1
+        task = asyncio.current_task()
+        if task is not None:
+            self._tasks.add(task)
+        span = (self.tracer.span("dispatch", update_id=getattr(update, "update_id", None))
+                if self.tracer is not None else NULL_SPAN)
+        try:
+            with span:
+                await self._process(update, coroutine, span)
+        except asyncio.CancelledError:
+            coroutine.close()  # type: ignore[attr-defined]  # not started yet if it was waiting for its lane
+            raise
+        finally:
+            self.in_flight -= 1
+            self._tasks.discard(task)
+
+    def cancel(self) -> int:
+        """Cancel the updates in flight (shutdown past its deadline); returns how many."""
+        for task in self._tasks:
+            task.cancel()
+        return len(self._tasks)
+
+    async def do_process_update(self, update: object, coroutine: "Awaitable[Any]") -> None:
+        await coroutine
+
+    async def _run(self, update: object, coroutine: "Awaitable[Any]") -> None:
+        async with self._semaphore:
+            await self.do_process_update(update, coroutine)
+
+    async def _process(self, update: object, coroutine: "Awaitable[Any]", span=NULL_SPAN) -> None:
+        key = lane_key(update)
+        if key is None:
+            await self._run(update, coroutine)
+            return
+        span.set(user_id=key)
+
+        lane = self._lanes.get(key)
+        if lane is None:
+            lane = self._lanes[key] = _Lane()
+        if lane.pending >= self.lane_depth:
+            self.dropped += 1
+            logger.warning("Lane of %s is full (%d updates), dropping update", key, lane.pending)
+            coroutine.close()  # type: ignore[attr-defined]
+            span.set(dropped=True)
+            return
+
+        lane.pending += 1
+        try:
+            queued = time.perf_counter()
+            async with lane.lock:
+                span.set(lane_wait_ms=round((time.perf_counter() - queued) * 1000, 3))
+                await self._run(update, coroutine)
+        finally:
+            lane.pending -= 1
+            if lane.pending == 0:
+                self._lanes.pop(key, None)
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        self._lanes.clear()
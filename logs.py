@@ -0,0 +1,203 @@
+# -*- coding: utf-8 -*-
+
+"""
+Non-blocking structured logging.
+
+Handlers on the event loop only put records on a queue (QueueHandler); one
+QueueListener thread formats them, redacts personal data and writes to stderr.
+A slow or blocked stderr no longer adds to handler latency. When the queue is
+full, records are dropped and counted instead of blocking.
+
+* JSON lines (LOG_FORMAT=json, the default) with update_id, user_id, handler
+  and duration_ms for records emitted while an update is handled (log_context),
+  LOG_FORMAT=text keeps the old human-readable format.
+* Redaction: passport numbers, phones and e-mails the users entered into their
+  forms (REDACTOR.remember_form), any "+<digits>" phone, any e-mail and the bot
+  token in Bot API URLs.
+* Sampling: INFO and below from high-volume loggers (LOG_SAMPLED, comma-separated)
+  is kept with probability LOG_SAMPLE_RATE; kept records carry "sampled": 1/rate.
+  Warnings and errors are always kept.
+
+Configured from the environment, by boot.py before the bot is imported.
+"""
+
+import atexit
+import contextvars
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import re
+import sys
+import time
+from typing import Any, Dict, Iterable, Optional
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json")  # json | text
+LOG_SAMPLE_RATE = float(os.getenv("LOG_SAMPLE_RATE", "0.1"))
+LOG_SAMPLED = os.getenv("LOG_SAMPLED", "bot.updates,httpx")
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+
+TEXT_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+PII_FIELDS = ("passport_number", "phone", "email")  # form fields, see bot.py
+CONTEXT_FIELDS = ("tenant", "update_id", "user_id", "handler", "trace", "duration_ms", "sampled")
+
+_CONTEXT: "contextvars.ContextVar[Dict[str, Any]]" = contextvars.ContextVar("log_context", default={})
+
+
+def log_context(**fields: Any) -> contextvars.Token:
+    """Attach fields to every record logged from the current task; reset with reset_log_context()."""
+    return _CONTEXT.set({**_CONTEXT.get(), **fields})
+
+
+def reset_log_context(token: contextvars.Token) -> None:
+    _CONTEXT.reset(token)
+
+
+# =========================
+# Redaction
+# =========================
+
+_EMAIL_RE = re.compile(r"[\w.+-]+@[\w-]+(?:\.[\w-]+)+")
+_PHONE_RE = re.compile(r"\+\d[\d\s().-]{5,}\d")
+_TOKEN_RE = re.compile(r"bot\d+:[\w-]+")
+_WORD_RE = re.compile(r"[\w@.+-]{5,}")  # shorter pieces are too common to redact
+
+
+class Redactor:
+    """Masks known personal values in log text.
+
+    Values are split into words and kept in a bounded set; a message is checked
+    word by word, so the cost does not grow with the number of remembered forms.
+    remember() runs on the event loop, redact() in the listener thread (lookups only).
+    """
+
+    def __init__(self, max_words: int = 50000) -> None:
+        self.max_words = max_words
+        self._words: Dict[str, None] = {}  # insertion-ordered set, oldest first
+
+    def remember(self, value: Optional[str]) -> None:
+        if not value:
+            return
+        for word in _WORD_RE.findall(str(value)):
+            self._words.pop(word, None)
+            self._words[word] = None
+        while len(self._words) > self.max_words:
+            del self._words[next(iter(self._words))]
+
+    def remember_form(self, form: Optional[Dict[str, Any]]) -> None:
+        if form:
+            for field in PII_FIELDS:
+                self.remember(form.get(field))
+
+    def redact(self, text: str) -> str:
+        text = _TOKEN_RE.sub("bot<token>", text)
+        text = _EMAIL_RE.sub("<email>", text)
+        text = _PHONE_RE.sub("<phone>", text)
+        words = self._words
+        if words:
+            text = _WORD_RE.sub(lambda m: "<redacted>" if m.group(0) in words else m.group(0), text)
+        return text
+
+
+REDACTOR = Redactor()
+
+
+# =========================
+# Formatting (listener thread)
+# =========================
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        data: Dict[str, Any] = {
+            "ts": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(record.created)) + f".{int(record.msecs):03d}Z",
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": REDACTOR.redact(record.getMessage()),
+        }
+        for field in CONTEXT_FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                data[field] = value
+        if record.exc_info:
+            data["exc"] = REDACTOR.redact(self.formatException(record.exc_info))
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+class RedactingFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        return REDACTOR.redact(super().format(record))
+
+
+# =========================
+# Enqueueing (caller side)
+# =========================
+
+class _Sampler(logging.Filter):
+    def __init__(self, loggers: Iterable[str], rate: float) -> None:
+        super().__init__()
+        self.loggers = tuple(loggers)
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > logging.INFO or self.rate >= 1:
+            return True
+        if not any(record.name == name or record.name.startswith(name + ".") for name in self.loggers):
+            return True
+        if random.random() >= self.rate:
+            return False
+        record.sampled = round(1 / self.rate, 3)
+        return True
+
+
+class AsyncQueueHandler(logging.handlers.QueueHandler):
+    def __init__(self, records: "queue.Queue[logging.LogRecord]") -> None:
+        super().__init__(records)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Only resolve the message (args may change later) and attach the task's
+        # context here; tracebacks and the formatting are done by the listener.
+        record.msg = record.getMessage()
+        record.args = None
+        for field, value in _CONTEXT.get().items():
+            if getattr(record, field, None) is None:
+                setattr(record, field, value)
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+_HANDLER: Optional[AsyncQueueHandler] = None
+
+
+def dropped_records() -> int:
+    return _HANDLER.dropped if _HANDLER is not None else 0
+
+
+def setup_logging() -> None:
+    """Route the root logger through the queue; idempotent."""
+    global _HANDLER
+    if _HANDLER is not None:
+        return
+    output = logging.StreamHandler(sys.stderr)
+    output.setFormatter(JsonFormatter() if LOG_FORMAT == "json" else RedactingFormatter(TEXT_FORMAT))
+    records: "queue.Queue[logging.LogRecord]" = queue.Queue(LOG_QUEUE_SIZE)
+    _HANDLER = AsyncQueueHandler(records)
+    _HANDLER.addFilter(_Sampler([n.strip() for n in LOG_SAMPLED.split(",") if n.strip()], LOG_SAMPLE_RATE))
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(_HANDLER)
+    root.setLevel(LOG_LEVEL)
+
+    listener = logging.handlers.QueueListener(records, output, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)  # writes out what is still queued
@@ -0,0 +1,186 @@
+# -*- coding: utf-8 -*-
+
+"""
+Tiny Prometheus-style metrics (counters, gauges, histograms) rendered in the
+text exposition format for GET /metrics. No dependencies, single event loop,
+so no locking.
+"""
+
+import abc
+import math
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+LabelValues = Tuple[str, ...]
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _fmt(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(str(v))}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class Metric(abc.ABC):
+    type = "untyped"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()) -> None:
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        return tuple(str(labels.get(n, "")) for n in self.labelnames)
+
+    @abc.abstractmethod
+    def samples(self) -> Iterable[str]:
+        """Exposition lines of every series."""
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+        lines.extend(self.samples())
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()) -> None:
+        super().__init__(name, help, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels: str) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def samples(self) -> Iterable[str]:
+        for key, value in sorted(self._values.items()):
+            yield f"{self.name}{_labels(self.labelnames, key)} {_fmt(value)}"
+
+
+class Gauge(Metric):
+    """Set explicitly, or computed on every scrape by fn() -> [(label values, value)]."""
+
+    type = "gauge"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (),
+                 fn: Optional[Callable[[], Iterable[Tuple[LabelValues, float]]]] = None) -> None:
+        super().__init__(name, help, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+        self.fn = fn
+
+    def set(self, value: float, **labels: str) -> None:
+        self._values[self._key(labels)] = value
+
+    def samples(self) -> Iterable[str]:
+        values = dict(self._values)
+        if self.fn is not None:
+            values.update((tuple(str(v) for v in k), val) for k, val in self.fn())
+        for key, value in sorted(values.items()):
+            yield f"{self.name}{_labels(self.labelnames, key)} {_fmt(value)}"
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS) -> None:
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        self._series: Dict[LabelValues, List[float]] = {}  # bucket counts..., sum, count
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        series = self._series.get(key)
+        if series is None:
+            series = self._series[key] = [0.0] * (len(self.buckets) + 2)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                series[i] += 1
+        series[-2] += value
+        series[-1] += 1
+
+    def samples(self) -> Iterable[str]:
+        for key, series in sorted(self._series.items()):
+            for bound, count in zip(self.buckets, series):
+                le = f'le="{_fmt(bound)}"'
+                yield f"{self.name}_bucket{_labels(self.labelnames, key, le)} {_fmt(count)}"
+            yield f"{self.name}_sum{_labels(self.labelnames, key)} {_fmt(series[-2])}"
+            yield f"{self.name}_count{_labels(self.labelnames, key)} {_fmt(series[-1])}"
+
+
+class Registry:
+    def __init__(self, const_labels: Optional[Dict[str, str]] = None) -> None:
+        self._metrics: Dict[str, Metric] = {}
+        # added to every sample, e.g. {"tenant": "russia"} for one of several bots in a process
+        self.const_labels = dict(const_labels or {})
+
+    def register(self, metric: Metric) -> Metric:
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, help, labelnames))  # type: ignore[return-value]
+
+    def gauge(self, name: str, help: str, labelnames: Sequence[str] = (), fn=None) -> Gauge:
+        return self.register(Gauge(name, help, labelnames, fn))  # type: ignore[return-value]
+
+    def histogram(self, name: str, help: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, help, labelnames, buckets))  # type: ignore[return-value]
+
+    def render(self) -> str:
+        return render_all([self])
+
+    def _samples(self, metric: Metric) -> Iterable[str]:
+        if not self.const_labels:
+            return metric.samples()
+        extra = ",".join(f'{n}="{_escape(str(v))}"' for n, v in self.const_labels.items())
+        return (_with_labels(sample, extra) for sample in metric.samples())
+
+
+def _with_labels(sample: str, extra: str) -> str:
+    series, value = sample.rsplit(" ", 1)
+    if series.endswith("}"):
+        return f"{series[:-1]},{extra}}} {value}"
+    return f"{series}{{{extra}}} {value}"
+
+
+def render_all(registries: Sequence[Registry]) -> str:
+    """One exposition for several registries: HELP/TYPE once per metric name."""
+    lines: List[str] = []
+    names: Dict[str, None] = {}
+    for registry in registries:
+        names.update(dict.fromkeys(registry._metrics))
+    for name in names:
+        header = False
+        for registry in registries:
+            metric = registry._metrics.get(name)
+            if metric is None:
+                continue
+            if not header:
+                lines += [f"# HELP {metric.name} {metric.help}", f"# TYPE {metric.name} {metric.type}"]
+                header = True
+            lines.extend(registry._samples(metric))
+    return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+
+"""
+Nationality eligibility index.
+
+ELIGIBLE_LIST is parsed once at startup into a dict of normalized names and
+aliases (case and diacritics folded: "türkiye", "TURKISH" -> "Turkey") plus a
+prefix trie over the names and aliases, used for autocomplete ("ger" ->
+Germany) and "did you mean" buttons.
+
+Only the start of a name matches: "korea" must not offer North Korea to a
+South Korean, every suggestion is a one-tap choice of an eligible country.
+Close spellings (similar(), "germny" -> Germany) are stricter still and are
+only shown as text for the user to type.
+"""
+
+import difflib
+import re
+import unicodedata
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# Country -> other spellings people type (demonyms, local/old names).
+# Countries that are not in the eligible list are simply ignored.
+DEFAULT_ALIASES: Dict[str, Tuple[str, ...]] = {
+    "Andorra": ("Andorran",),
+    "Austria": ("Austrian", "Österreich"),
+    "Bahrain": ("Bahraini",),
+    "Belgium": ("Belgian",),
+    "Bulgaria": ("Bulgarian",),
+    "Cambodia": ("Cambodian", "Khmer"),
+    "China": ("Chinese", "PRC", "People's Republic of China"),
+    "Croatia": ("Croatian", "Hrvatska"),
+    "Cyprus": ("Cypriot",),
+    "Czech Republic": ("Czechia", "Czech"),
+    "Denmark": ("Danish", "Dane"),
+    "Estonia": ("Estonian", "Eesti"),
+    "Finland": ("Finnish", "Finn", "Suomi"),
+    "France": ("French",),
+    "Germany": ("German", "Deutschland"),
+    "Greece": ("Greek", "Hellas"),
+    "Hungary": ("Hungarian", "Magyar"),
+    "Iceland": ("Icelandic", "Icelander"),
+    "India": ("Indian", "Bharat"),
+    "Indonesia": ("Indonesian",),
+    "Iran": ("Iranian", "Persia", "Persian"),
+    "Ireland": ("Irish", "Eire"),
+    "Italy": ("Italian", "Italia"),
+    "Japan": ("Japanese", "Nippon"),
+    "North Korea": ("North Korean", "DPRK"),
+    "Kuwait": ("Kuwaiti",),
+    "Latvia": ("Latvian",),
+    "Liechtenstein": ("Liechtensteiner",),
+    "Lithuania": ("Lithuanian",),
+    "Luxembourg": ("Luxembourger", "Luxembourgish"),
+    "Malaysia": ("Malaysian",),
+    "Malta": ("Maltese",),
+    "Mexico": ("Mexican", "México"),
+    "Monaco": ("Monegasque", "Monacan"),
+    "Myanmar": ("Burma", "Burmese"),
+    "Netherlands": ("Dutch", "Holland", "The Netherlands"),
+    "North Macedonia": ("Macedonia", "Macedonian"),
+    "Norway": ("Norwegian",),
+    "Oman": ("Omani",),
+    "Philippines": ("Filipino", "Philippine"),
+    "Poland": ("Polish", "Pole"),
+    "Portugal": ("Portuguese",),
+    "Romania": ("Romanian",),
+    "San Marino": ("Sammarinese",),
+    "Saudi Arabia": ("Saudi", "KSA"),
+    "Serbia": ("Serbian", "Serb"),
+    "Singapore": ("Singaporean",),
+    "Slovakia": ("Slovak", "Slovakian"),
+    "Slovenia": ("Slovenian", "Slovene"),
+    "Spain": ("Spanish", "España"),
+    "Sweden": ("Swedish", "Swede"),
+    "Switzerland": ("Swiss",),
+    "Taiwan": ("Taiwanese",),
+    "Turkey": ("Turkish", "Türkiye", "Turkiye"),
+    "Vatican": ("Vatican City", "Holy See"),
+    "Vietnam": ("Vietnamese", "Viet Nam"),
+}
+
+_NON_WORD = re.compile(r"[^a-z0-9]+")
+
+SIMILAR_CUTOFF = 0.85  # "south korea" ~ "north korea" is 0.82, "germny" ~ "germany" 0.92
+
+
+def normalize(text: str) -> str:
+    """Fold case and diacritics, keep only letters/digits separated by single spaces."""
+    decomposed = unicodedata.normalize("NFKD", text)
+    stripped = "".join(ch for ch in decomposed if not unicodedata.combining(ch))
+    return _NON_WORD.sub(" ", stripped.casefold()).strip()
+
+
+def parse_list(text: str) -> List[str]:
+    """"Andorra, Austria, … Vietnam." -> ["Andorra", "Austria", …, "Vietnam"]"""
+    return [name.strip().rstrip(".").strip() for name in text.split(",") if name.strip(" .")]
+
+
+class _TrieNode:
+    __slots__ = ("children", "names")
+
+    def __init__(self) -> None:
+        self.children: Dict[str, "_TrieNode"] = {}
+        self.names: List[str] = []  # canonical names reachable below this node
+
+
+class NationalityIndex:
+    def __init__(self, names: Iterable[str], aliases: Optional[Dict[str, Tuple[str, ...]]] = None) -> None:
+        self.names: List[str] = list(names)
+        self._keys: Dict[str, str] = {}  # normalized name/alias -> canonical name
+        self._trie = _TrieNode()
+
+        aliases = aliases or {}
+        for name in self.names:
+            for variant in (name,) + tuple(aliases.get(name, ())):
+                key = normalize(variant)
+                if key:
+                    self._keys.setdefault(key, name)
+        for key, name in self._keys.items():
+            self._insert(key, name)  # from the first word only, see the module docstring
+        self._sort(self._trie)
+
+    @classmethod
+    def from_text(cls, text: str, aliases: Optional[Dict[str, Tuple[str, ...]]] = None) -> "NationalityIndex":
+        return cls(parse_list(text), DEFAULT_ALIASES if aliases is None else aliases)
+
+    def _insert(self, key: str, name: str) -> None:
+        node = self._trie
+        for ch in key:
+            node = node.children.setdefault(ch, _TrieNode())
+            if name not in node.names:
+                node.names.append(name)
+
+    def _sort(self, node: _TrieNode) -> None:
+        node.names.sort()
+        for child in node.children.values():
+            self._sort(child)
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def lookup(self, text: str) -> Optional[str]:
+        """Canonical eligible nationality for the user's input, or None."""
+        return self._keys.get(normalize(text))
+
+    def complete(self, prefix: str, limit: int = 10) -> List[str]:
+        """Eligible nationalities whose name (or another spelling of it) starts with prefix."""
+        node = self._trie
+        for ch in normalize(prefix):
+            node = node.children.get(ch)
+            if node is None:
+                return []
+        return node.names[:limit]
+
+    def similar(self, text: str, limit: int = 3) -> List[str]:
+        """Close spellings of an eligible nationality ("germny" -> Germany); a hint, not a choice."""
+        close = difflib.get_close_matches(normalize(text), list(self._keys), n=limit * 2, cutoff=SIMILAR_CUTOFF)
+        out: List[str] = []
+        for key in close:
+            name = self._keys[key]
+            if name not in out:
+                out.append(name)
+        return out[:limit]
@@ -0,0 +1,333 @@
+# -*- coding: utf-8 -*-
+
+"""
+Automatic payment confirmation from PayPal Instant Payment Notifications (IPN).
+
+The "Pay" button links to PAYPAL_URL with the user's order reference
+(invoice=<ref>, or substituted for "{order_ref}" in the URL). For every
+payment PayPal posts a notification to POST /paypal/ipn:
+
+1. The notification is sent back to PayPal verbatim (cmd=_notify-validate),
+   which answers VERIFIED or INVALID, so forged requests confirm nothing.
+2. It is recorded in a ledger keyed by txn_id. Retries and duplicates
+   update the same row and are applied once, across replicas too.
+3. A completed payment of the expected amount, currency and receiver is
+   matched to the application by its order reference and confirmed by the
+   same flow as the admin's "Mark as paid" button.
+
+Payments that could not be applied yet (the form is not submitted, sending
+failed, the process stopped halfway) stay in the ledger. reconcile() retries
+them: at startup, every `interval` seconds and on /reconcile. Payments that
+need a human (wrong amount, unknown reference, refunds) go to the admin once.
+"""
+
+import asyncio
+import hashlib
+import hmac
+import logging
+import time
+from decimal import Decimal, InvalidOperation
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+from aiohttp import ClientError, ClientSession, ClientTimeout
+
+from database import Database, open_database
+
+logger = logging.getLogger(__name__)
+
+COMPLETED = "Completed"
+CLAIM_LEASE = 300.0  # seconds; a claim older than this is taken over (the claimer died)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS payments (
+    txn_id      TEXT PRIMARY KEY,
+    user_id     INTEGER,
+    order_ref   TEXT,
+    status      TEXT NOT NULL,
+    amount      TEXT NOT NULL,
+    currency    TEXT NOT NULL,
+    problem     TEXT,
+    received_at REAL NOT NULL,
+    claimed_at  REAL,
+    applied_at  REAL
+);
+CREATE INDEX IF NOT EXISTS payments_unapplied_idx ON payments (applied_at, status);
+"""
+
+
+# =========================
+# Order references
+# =========================
+
+def order_ref(user_id: int, secret: str) -> str:
+    """Reference put into the payment link: "<user_id>-<signature>"."""
+    sig = hmac.new(secret.encode(), str(user_id).encode(), hashlib.sha256).hexdigest()[:10]
+    return f"{user_id}-{sig}"
+
+
+def parse_order_ref(ref: Optional[str], secret: str) -> Optional[int]:
+    """user_id of a reference made by order_ref(); None if it is not ours."""
+    ref = (ref or "").strip()
+    if not secret:
+        return None  # no secret configured: references can not be trusted
+    user_id = ref.partition("-")[0]
+    if not user_id.isdigit() or not hmac.compare_digest(order_ref(int(user_id), secret), ref):
+        return None
+    return int(user_id)
+
+
+def payment_url(base: str, ref: str, notify_url: Optional[str] = None) -> str:
+    """PAYPAL_URL for one application: "{order_ref}" substituted, or invoice=<ref> (and notify_url) added."""
+    if "{order_ref}" in base:
+        return base.replace("{order_ref}", ref)
+    parts = urlsplit(base)
+    query = parse_qsl(parts.query, keep_blank_values=True)
+    query.append(("invoice", ref))
+    if notify_url:
+        query.append(("notify_url", notify_url))
+    return urlunsplit(parts._replace(query=urlencode(query)))
+
+
+# =========================
+# Ledger
+# =========================
+
+class Payment:
+    __slots__ = ("txn_id", "status", "amount", "currency", "receiver", "ref", "user_id")
+
+    def __init__(self, fields: Dict[str, str], secret: str) -> None:
+        self.txn_id = fields.get("txn_id", "")
+        self.status = fields.get("payment_status", "")
+        self.amount = fields.get("mc_gross", "")
+        self.currency = fields.get("mc_currency", "")
+        self.receiver = fields.get("receiver_email", "")
+        # invoice is the documented pass-through field; custom for links that use it instead
+        self.ref = fields.get("invoice") or fields.get("custom") or ""
+        self.user_id = parse_order_ref(self.ref, secret)
+
+
+class PaymentLedger:
+    """Received payments in the database (next to the forms, shared by replicas)."""
+
+    def __init__(self, database: Database) -> None:
+        self.db = database
+
+    async def create(self) -> None:
+        await self.db.script(_SCHEMA)
+
+    async def record(self, payment: Payment, problem: Optional[str]) -> bool:
+        """Insert or update (Pending -> Completed …) a payment; False if it is applied already."""
+        changed = await self.db.execute(
+            "INSERT INTO payments (txn_id, user_id, order_ref, status, amount, currency, problem, received_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT(txn_id) DO UPDATE SET status = excluded.status, problem = excluded.problem "
+            "WHERE payments.applied_at IS NULL",
+            (payment.txn_id, payment.user_id, payment.ref, payment.status, payment.amount,
+             payment.currency, problem, time.time()),
+        )
+        return changed == 1
+
+    async def claim(self, txn_id: str) -> bool:
+        """Take the payment for applying; False if it is applied or another worker has it."""
+        now = time.time()
+        changed = await self.db.execute(
+            "UPDATE payments SET claimed_at = ? WHERE txn_id = ? AND applied_at IS NULL "
+            "AND (claimed_at IS NULL OR claimed_at < ?)",
+            (now, txn_id, now - CLAIM_LEASE),
+        )
+        return changed == 1
+
+    async def release(self, txn_id: str, applied: bool) -> None:
+        await self.db.execute("UPDATE payments SET claimed_at = NULL, applied_at = ? WHERE txn_id = ?",
+                              (time.time() if applied else None, txn_id))
+
+    async def unapplied(self, limit: int = 500) -> List[Tuple[str, int]]:
+        """(txn_id, user_id) of completed, matched payments still waiting to be applied."""
+        return await self.db.fetch(
+            "SELECT txn_id, user_id FROM payments WHERE applied_at IS NULL AND status = ? "
+            "AND problem IS NULL AND user_id IS NOT NULL ORDER BY received_at LIMIT ?",
+            (COMPLETED, limit),
+        )
+
+    async def counts(self) -> Dict[str, int]:
+        rows = await self.db.fetch(
+            "SELECT CASE WHEN applied_at IS NOT NULL THEN 'applied' "
+            "WHEN problem IS NOT NULL THEN 'problem' ELSE 'waiting' END, COUNT(*) "
+            "FROM payments GROUP BY 1"
+        )
+        return {kind: count for kind, count in rows}
+
+    async def close(self) -> None:
+        await self.db.close()
+
+
+# =========================
+# Reconciler
+# =========================
+
+class PaymentReconciler:
+    def __init__(self, database: str, verify_url: str, secret: str, amount: str, currency: str,
+                 receiver_email: str = "",
+                 confirm: Optional[Callable[[int, str], Awaitable[bool]]] = None,
+                 notify: Optional[Callable[[str], Awaitable[Any]]] = None,
+                 interval: float = 600.0, timeout: float = 20.0) -> None:
+        self.database = database  # postgres:// URL or SQLite file, see open_database()
+        self.verify_url = verify_url
+        self.secret = secret
+        self.amount = Decimal(amount)
+        self.currency = currency
+        self.receiver_email = receiver_email.lower()
+        # confirm(user_id, txn_id) -> True when the application is confirmed (or was already),
+        # False to retry later; notify(text) tells the admin about payments that need a look
+        self.confirm = confirm
+        self.notify = notify
+        self.interval = interval
+        self._timeout = ClientTimeout(total=timeout)
+
+        self.ledger: Optional[PaymentLedger] = None
+        self._session: Optional[ClientSession] = None
+        self._task: Optional[asyncio.Task] = None
+        self._applying: Set[asyncio.Task] = set()
+        self.invalid = 0
+        self.applied = 0
+
+    # --- notifications ---
+
+    async def _verify(self, body: bytes) -> Optional[bool]:
+        """PayPal's verdict on a notification; None if PayPal could not be asked."""
+        if self._session is None:
+            self._session = ClientSession(timeout=self._timeout)
+        try:
+            async with self._session.post(
+                self.verify_url, data=b"cmd=_notify-validate&" + body,
+                headers={"Content-Type": "application/x-www-form-urlencoded", "User-Agent": "visa-bot-ipn"},
+            ) as resp:
+                verdict = (await resp.text()).strip()
+        except (ClientError, OSError, asyncio.TimeoutError) as e:
+            logger.warning("IPN verification request failed: %s", e)
+            return None
+        return verdict == "VERIFIED"
+
+    def _problem(self, payment: Payment) -> Optional[str]:
+        """Why a verified payment can not be applied automatically; None — it can (or is Pending)."""
+        if payment.status not in (COMPLETED, "Pending"):
+            return f"status {payment.status}"  # Refunded, Reversed, Denied …
+        if payment.user_id is None:
+            return f"unknown order reference {payment.ref!r}"
+        if self.receiver_email and payment.receiver.lower() != self.receiver_email:
+            return f"paid to {payment.receiver}"
+        if payment.currency != self.currency:
+            return f"currency {payment.currency}"
+        try:
+            if Decimal(payment.amount) < self.amount:
+                return f"amount {payment.amount} {payment.currency}"
+        except InvalidOperation:
+            return f"amount {payment.amount!r}"
+        return None
+
+    async def handle(self, body: bytes) -> int:
+        """Process one notification; returns the HTTP status for PayPal (non-2xx — PayPal retries)."""
+        if self.ledger is None:
+            return 503
+        fields = dict(parse_qsl(body.decode("ascii", "replace"), keep_blank_values=True))
+        charset = fields.get("charset", "utf-8")
+        try:
+            fields = dict(parse_qsl(body.decode("ascii", "replace"), keep_blank_values=True,
+                                    encoding=charset, errors="replace"))
+        except LookupError:
+            pass  # unknown charset: only names/notes are affected, the ids are ASCII
+
+        verified = await self._verify(body)
+        if verified is None:
+            return 503
+        if not verified:
+            self.invalid += 1
+            logger.warning("IPN not verified by PayPal, ignored (txn %s)", fields.get("txn_id"))
+            return 200
+        payment = Payment(fields, self.secret)
+        if not payment.txn_id:
+            return 200  # not a payment (e.g. a subscription sign-up)
+
+        problem = self._problem(payment)
+        if not await self.ledger.record(payment, problem):
+            return 200  # applied already: PayPal's retry or a duplicate
+        if problem is not None:
+            logger.warning("Payment %s needs a look: %s", payment.txn_id, problem)
+            await self._notify(f"⚠️ PayPal payment {payment.txn_id} ({payment.amount} {payment.currency}, "
+                               f"reference {payment.ref or '—'}) was not applied: {problem}.")
+        elif payment.status == COMPLETED:
+            # PayPal only needs the 200; the confirmation (PDF to the admin …) runs on its own
+            task = asyncio.create_task(self.apply(payment.txn_id, payment.user_id))
+            self._applying.add(task)
+            task.add_done_callback(self._applying.discard)
+        return 200
+
+    async def _notify(self, text: str) -> None:
+        if self.notify is not None:
+            try:
+                await self.notify(text)
+            except Exception as e:
+                logger.warning("Could not notify the admin about a payment: %s", e)
+
+    # --- applying ---
+
+    async def apply(self, txn_id: str, user_id: int) -> bool:
+        if not await self.ledger.claim(txn_id):
+            return False
+        applied = False
+        try:
+            applied = await self.confirm(user_id, txn_id)
+        except Exception:
+            logger.exception("Confirming payment %s of %s failed", txn_id, user_id)
+        finally:
+            await self.ledger.release(txn_id, applied)
+        if applied:
+            self.applied += 1
+        return applied
+
+    async def reconcile(self) -> Tuple[int, int]:
+        """Apply the backlog; returns (applied now, still waiting)."""
+        if self.ledger is None:
+            return 0, 0
+        backlog = await self.ledger.unapplied()
+        results = [await self.apply(txn_id, user_id) for txn_id, user_id in backlog]
+        applied = sum(results)
+        if backlog:
+            logger.info("Reconciled payments: %d applied, %d still waiting", applied, len(backlog) - applied)
+        return applied, len(backlog) - applied
+
+    async def _loop(self) -> None:
+        while True:
+            try:
+                await self.reconcile()
+            except Exception:
+                logger.exception("Payment reconciliation failed")
+            await asyncio.sleep(self.interval)
+
+    # --- lifecycle ---
+
+    async def start(self) -> None:
+        if self.ledger is None:
+            self.ledger = PaymentLedger(open_database(self.database))
+            await self.ledger.create()
+        if self._task is None:
+            self._task = asyncio.create_task(self._loop(), name="payment-reconciler")
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._applying:
+            # let confirmations in progress finish; unfinished ones are retried after the restart
+            await asyncio.wait(self._applying, timeout=10)
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+        if self.ledger is not None:
+            await self.ledger.close()
+            self.ledger = None
@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+
+"""
+Conversation states and user_data in a database shared by all bot replicas.
+
+PicklePersistence keeps one file per process, which is fine for a single
+instance. With several replicas (see sharding.py) every replica has to see
+the same states, e.g. after the replica set changes and users move to a new
+owner. This backend keeps them in the database next to the forms table
+(PostgreSQL, or the SQLite stand-in, see database.py).
+"""
+
+import json
+import pickle
+from typing import Any, Dict, List, Optional, Tuple
+
+from telegram.ext import BasePersistence, PersistenceInput
+from telegram.ext._utils.types import CDCData, ConversationDict, ConversationKey
+
+from database import Database
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS conversations (
+    name  TEXT NOT NULL,
+    key   TEXT NOT NULL,
+    state BLOB NOT NULL,
+    PRIMARY KEY (name, key)
+);
+CREATE TABLE IF NOT EXISTS user_data (
+    user_id INTEGER PRIMARY KEY,
+    data    BLOB NOT NULL
+);
+"""
+
+
+class DatabasePersistence(BasePersistence[Dict[Any, Any], Dict[Any, Any], Dict[Any, Any]]):
+    """Stores conversations and user_data (chat/bot/callback data are not used by the bot)."""
+
+    def __init__(self, database: Database, store_data: Optional[PersistenceInput] = None,
+                 update_interval: float = 60) -> None:
+        super().__init__(
+            store_data=store_data or PersistenceInput(bot_data=False, chat_data=False, callback_data=False),
+            update_interval=update_interval,
+        )
+        self.db = database
+        self._created = False
+
+    async def _create(self) -> None:
+        # Application.initialize() reads the states first, that creates the tables
+        if not self._created:
+            await self.db.script(_SCHEMA)
+            self._created = True
+
+    async def _run(self, sql: str, params: Tuple[Any, ...]) -> None:
+        await self._create()
+        await self.db.execute(sql, params)
+
+    async def _fetch(self, sql: str, params: Tuple[Any, ...] = ()) -> List[Tuple[Any, ...]]:
+        await self._create()
+        return await self.db.fetch(sql, params)
+
+    # --- conversations ---
+
+    async def get_conversations(self, name: str) -> ConversationDict:
+        rows = await self._fetch("SELECT key, state FROM conversations WHERE name = ?", (name,))
+        return {tuple(json.loads(key)): pickle.loads(state) for key, state in rows}
+
+    async def update_conversation(self, name: str, key: ConversationKey, new_state: Optional[object]) -> None:
+        if new_state is None:  # conversation ended
+            await self._run("DELETE FROM conversations WHERE name = ? AND key = ?", (name, json.dumps(key)))
+            return
+        await self._run(
+            "INSERT INTO conversations (name, key, state) VALUES (?, ?, ?) "
+            "ON CONFLICT(name, key) DO UPDATE SET state = excluded.state",
+            (name, json.dumps(key), pickle.dumps(new_state)),
+        )
+
+    # --- user_data ---
+
+    async def get_user_data(self) -> Dict[int, Dict[Any, Any]]:
+        rows = await self._fetch("SELECT user_id, data FROM user_data")
+        return {user_id: pickle.loads(data) for user_id, data in rows}
+
+    async def update_user_data(self, user_id: int, data: Dict[Any, Any]) -> None:
+        await self._run(
+            "INSERT INTO user_data (user_id, data) VALUES (?, ?) "
+            "ON CONFLICT(user_id) DO UPDATE SET data = excluded.data",
+            (user_id, pickle.dumps(data)),
+        )
+
+    async def drop_user_data(self, user_id: int) -> None:
+        await self._run("DELETE FROM user_data WHERE user_id = ?", (user_id,))
+
+    async def refresh_user_data(self, user_id: int, user_data: Dict[Any, Any]) -> None:
+        # updates of a user are handled by its owner replica only, memory is up to date
+        pass
+
+    # --- not stored ---
+
+    async def get_chat_data(self) -> Dict[int, Dict[Any, Any]]:
+        return {}
+
+    async def get_bot_data(self) -> Dict[Any, Any]:
+        return {}
+
+    async def get_callback_data(self) -> Optional[CDCData]:
+        return None
+
+    async def update_chat_data(self, chat_id: int, data: Dict[Any, Any]) -> None:
+        pass
+
+    async def update_bot_data(self, data: Dict[Any, Any]) -> None:
+        pass
+
+    async def update_callback_data(self, data: CDCData) -> None:
+        pass
+
+    async def drop_chat_data(self, chat_id: int) -> None:
+        pass
+
+    async def refresh_chat_data(self, chat_id: int, chat_data: Dict[Any, Any]) -> None:
+        pass
+
+    async def refresh_bot_data(self, bot_data: Dict[Any, Any]) -> None:
+        pass
+
+    async def flush(self) -> None:
+        # every update is committed right away; called last by Application.shutdown()
+        await self.db.close()
@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+
+"""
+Adaptive long polling (replaces Updater.start_polling()).
+
+* allowed_updates is derived from the registered handlers, so Telegram does
+  not send update types nobody handles (edited messages, chat member updates …).
+* The batch limit follows recent traffic and local backlog: small batches when
+  quiet, up to 100 in bursts, and never more than the processor has room for —
+  updates wait at Telegram instead of in our queue.
+* The long-poll timeout is long when idle (fewer requests) and short when busy
+  (a new limit is applied sooner).
+"""
+
+import asyncio
+import logging
+import time
+from typing import Callable, Iterable, List, Optional
+
+from telegram import Update
+from telegram.error import InvalidToken, RetryAfter, TelegramError
+from telegram.ext import (
+    BaseHandler,
+    CallbackQueryHandler,
+    CommandHandler,
+    ConversationHandler,
+    InlineQueryHandler,
+    MessageHandler,
+    TypeHandler,
+)
+
+from router import RouterHandler
+
+logger = logging.getLogger(__name__)
+
+MAX_LIMIT = 100  # Bot API maximum for getUpdates
+
+
+def _handler_update_types(handler: BaseHandler) -> Optional[List[str]]:
+    """Update types a handler can match; None — unknown, needs everything."""
+    if isinstance(handler, ConversationHandler):
+        types: List[str] = []
+        nested = list(handler.entry_points) + list(handler.fallbacks)
+        for handlers in handler.states.values():
+            nested.extend(handlers)
+        for sub in nested:
+            sub_types = _handler_update_types(sub)
+            if sub_types is None:
+                return None
+            types.extend(sub_types)
+        return types
+    if isinstance(handler, (MessageHandler, CommandHandler)):
+        return [Update.MESSAGE]
+    if isinstance(handler, (CallbackQueryHandler, RouterHandler)):
+        return [Update.CALLBACK_QUERY]
+    if isinstance(handler, InlineQueryHandler):
+        return [Update.INLINE_QUERY]
+    return None
+
+
+def allowed_updates_for(handlers: Iterable[BaseHandler]) -> List[str]:
+    """Update types to request from Telegram for the given handlers.
+
+    TypeHandler(Update) only observes (see touch_session in bot.py) and does not widen the list.
+    """
+    types = set()
+    for handler in handlers:
+        if isinstance(handler, TypeHandler) and handler.type is Update:
+            continue
+        handler_types = _handler_update_types(handler)
+        if handler_types is None:
+            return list(Update.ALL_TYPES)
+        types.update(handler_types)
+    return sorted(types)
+
+
+class AdaptivePoller:
+    def __init__(self, bot, update_queue: "asyncio.Queue[object]", allowed_updates: List[str],
+                 capacity: int, backlog: Callable[[], int],
+                 min_timeout: int = 1, max_timeout: int = 30, min_limit: int = 10,
+                 observer: Optional[Callable[[List[Update], float], None]] = None) -> None:
+        self.bot = bot
+        self.update_queue = update_queue
+        self.allowed_updates = allowed_updates
+        # updates we are willing to hold locally (queued + being processed)
+        self.capacity = capacity
+        self.backlog = backlog
+        self.min_timeout = min_timeout
+        self.max_timeout = max_timeout
+        self.min_limit = min_limit
+        # observer(batch, seconds the getUpdates call took)
+        self.observer = observer
+
+        self.limit = min_limit
+        self.timeout = max_timeout
+        self.rate = 0.0  # EWMA of updates per batch
+        self._offset: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def _adapt(self, received: int) -> None:
+        self.rate = 0.7 * self.rate + 0.3 * received
+        busy = received > 0 or self.rate >= 1
+        self.timeout = self.min_timeout if busy else self.max_timeout
+        # headroom for bursts, but only as much as the processor can take now
+        wanted = max(self.min_limit, min(MAX_LIMIT, int(self.rate * 2) + 1))
+        room = self.capacity - self.backlog()
+        self.limit = max(1, min(wanted, room))
+
+    async def _wait_for_room(self) -> None:
+        while self.backlog() >= self.capacity:
+            await asyncio.sleep(0.05)
+
+    async def _poll(self) -> None:
+        backoff = 1.0
+        while True:
+            await self._wait_for_room()
+            started = time.perf_counter()
+            try:
+                updates = await self.bot.get_updates(
+                    offset=self._offset, limit=self.limit, timeout=self.timeout,
+                    allowed_updates=self.allowed_updates,
+                )
+            except RetryAfter as e:
+                await asyncio.sleep(e.retry_after)
+                continue
+            except InvalidToken:
+                logger.critical("getUpdates: invalid bot token, polling stopped")
+                raise
+            except TelegramError as e:
+                # NetworkError, TimedOut, Conflict (another instance polls with the same token) …
+                logger.warning("getUpdates failed (%s), retrying in %.0fs", e, backoff)
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, 30.0)
+                continue
+            backoff = 1.0
+
+            if self.observer is not None:
+                self.observer(updates, time.perf_counter() - started)
+            for update in updates:
+                await self.update_queue.put(update)
+            if updates:
+                self._offset = updates[-1].update_id + 1
+            self._adapt(len(updates))
+
+    async def start(self) -> None:
+        # getUpdates does not work while a webhook is set
+        await self.bot.delete_webhook()
+        if self._task is None:
+            self._task = asyncio.create_task(self._poll(), name="adaptive-polling")
+        logger.info("Polling for %s", ", ".join(self.allowed_updates))
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except (asyncio.CancelledError, TelegramError):
+            pass  # cancelled, or already stopped by an invalid token (logged)
+        self._task = None
+        if self._offset is not None:
+            # confirm what we fetched, so it is not delivered again after a restart
+            try:
+                await self.bot.get_updates(offset=self._offset, limit=1, timeout=0,
+                                           allowed_updates=self.allowed_updates)
+            except TelegramError as e:
+                logger.warning("Could not confirm fetched updates: %s", e)
@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+
+"""
+Idle-session reaper for ConversationHandlers.
+
+ConversationHandler.conversation_timeout needs the JobQueue (APScheduler) and
+one job per user. Instead a single background task scans the watched
+conversations every `interval` seconds and ends the ones that have been idle
+longer than the TTL of their current state. Activity comes from touch(),
+called for every incoming update.
+
+Ending a conversation goes through ConversationHandler's own dict, so the
+persistence backend sees it like a normal END. What else is freed (forms,
+user_data) and what is recorded is up to on_abandon.
+"""
+
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, Dict, Hashable, List, Optional, Set, Tuple
+
+from telegram.ext import ConversationHandler
+
+logger = logging.getLogger(__name__)
+
+Key = Tuple[Hashable, ...]  # ConversationHandler key, (chat_id, user_id) by default
+
+
+class SessionReaper:
+    def __init__(self, default_ttl: float, ttls: Optional[Dict[object, float]] = None,
+                 interval: float = 300.0, nudge_after: Optional[float] = None,
+                 on_abandon: Optional[Callable[[Key, object], None]] = None,
+                 on_nudge: Optional[Callable[[Key, object], Awaitable[object]]] = None) -> None:
+        self.default_ttl = default_ttl
+        self.ttls = ttls or {}
+        self.interval = interval
+        # idle seconds after which on_nudge is called once per session (None — never)
+        self.nudge_after = nudge_after
+        self.on_abandon = on_abandon
+        self.on_nudge = on_nudge
+
+        self._conversations: List[ConversationHandler] = []
+        self._seen: Dict[Key, float] = {}  # key -> last activity (monotonic)
+        self._nudged: Set[Key] = set()
+        self._task: Optional[asyncio.Task] = None
+        self.reaped = 0
+        self.nudged = 0
+
+    def watch(self, *conversations: ConversationHandler) -> None:
+        self._conversations.extend(conversations)
+
+    def ttl(self, state: object) -> float:
+        return self.ttls.get(state, self.default_ttl)
+
+    def touch(self, key: Key) -> None:
+        self._seen[key] = time.monotonic()
+        self._nudged.discard(key)
+
+    # --- scan ---
+
+    def scan(self, now: Optional[float] = None) -> List[Tuple[Key, object]]:
+        """End idle conversations; returns the sessions to nudge."""
+        now = time.monotonic() if now is None else now
+        to_nudge = []
+        for conv in self._conversations:
+            conversations = conv._conversations  # no public API for this
+            for key, state in list(conversations.items()):
+                seen = self._seen.get(key)
+                if seen is None:
+                    # restored from persistence after a restart: the clock starts now
+                    self._seen[key] = now
+                    continue
+                idle = now - seen
+                if idle > self.ttl(state):
+                    del conversations[key]  # tracked: persistence drops the state as well
+                    self._forget(key)
+                    self.reaped += 1
+                    if self.on_abandon is not None:
+                        try:
+                            self.on_abandon(key, state)
+                        except Exception:
+                            logger.exception("on_abandon failed for %s", key)
+                elif (self.nudge_after is not None and idle > self.nudge_after
+                      and key not in self._nudged and self.on_nudge is not None):
+                    self._nudged.add(key)
+                    to_nudge.append((key, state))
+
+        # activity of users without a conversation is not needed, keeps _seen bounded
+        active = set()
+        for conv in self._conversations:
+            active.update(conv._conversations)
+        for key in [k for k in self._seen if k not in active]:
+            self._forget(key)
+        return to_nudge
+
+    def _forget(self, key: Key) -> None:
+        self._seen.pop(key, None)
+        self._nudged.discard(key)
+
+    async def _loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            for key, state in self.scan():
+                try:
+                    await self.on_nudge(key, state)
+                    self.nudged += 1
+                except Exception as e:
+                    logger.warning("Nudge for %s failed: %s", key, e)
+
+    async def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._loop(), name="session-reaper")
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+
+"""
+Compiled callback_data router.
+
+Exact actions ("apply", "user_paid") live in a dict, parameterized ones
+("set_nat:<nat>", "admin_mark_paid:<id>") in a prefix trie, so resolving a
+button press costs one dict lookup or one walk over the callback_data string —
+no matter how many menus there are. Parsed arguments are put into context.args
+(like CommandHandler does); observer(router, route, seconds) gets the handling
+time of every press (bot.py exports it in /metrics).
+"""
+
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from telegram import Update
+from telegram.ext import BaseHandler
+
+Callback = Callable[..., Awaitable[Any]]
+
+
+def number(data: str) -> int:
+    """parse= for ids and page numbers: plain digits only (int() also takes "-5", " 5" and "+5")."""
+    if not (data.isascii() and data.isdigit()):
+        raise ValueError(f"not a number: {data!r}")
+    return int(data)
+
+
+class Route:
+    __slots__ = ("name", "callback", "parse")
+
+    def __init__(self, name: str, callback: Callback, parse: Optional[Callable[[str], Any]] = None) -> None:
+        self.name = name
+        self.callback = callback
+        self.parse = parse
+
+
+class _Node:
+    __slots__ = ("children", "route")
+
+    def __init__(self) -> None:
+        self.children: Dict[str, "_Node"] = {}
+        self.route: Optional[Route] = None
+
+
+class CallbackRouter:
+    def __init__(self, fallback: Optional[Callback] = None, name: str = "",
+                 observer: Optional[Callable[[str, str, float], None]] = None) -> None:
+        self.name = name
+        self.observer = observer
+        self._exact: Dict[str, Route] = {}
+        self._trie = _Node()
+        self._routes: Dict[str, Route] = {}
+        self.fallback = Route("<unknown>", fallback) if fallback else None
+
+    def add(self, action: str, callback: Callback, name: Optional[str] = None) -> Route:
+        """Exact callback_data, e.g. add("apply", on_menu_click)."""
+        route = Route(name or action, callback)
+        self._exact[action] = route
+        self._routes[route.name] = route
+        return route
+
+    def add_prefix(self, prefix: str, callback: Callback, parse: Optional[Callable[[str], Any]] = None,
+                   name: Optional[str] = None) -> Route:
+        """Parameterized callback_data, e.g. add_prefix("admin_mark_paid:", cb, parse=number).
+
+        The rest of the data after the prefix is passed as context.args[0]; if
+        parse raises ValueError the button does not match this route.
+        """
+        route = Route(name or prefix.rstrip(":"), callback, parse)
+        node = self._trie
+        for ch in prefix:
+            node = node.children.setdefault(ch, _Node())
+        node.route = route
+        self._routes[route.name] = route
+        return route
+
+    def resolve(self, data: str) -> Optional[Tuple[Route, List[Any]]]:
+        route = self._exact.get(data)
+        if route is not None:
+            return route, []
+
+        # longest registered prefix wins
+        node, match, end = self._trie, None, 0
+        for i, ch in enumerate(data):
+            node = node.children.get(ch)
+            if node is None:
+                break
+            if node.route is not None:
+                match, end = node.route, i + 1
+        if match is None:
+            return None
+        arg: Any = data[end:]
+        if match.parse is not None:
+            try:
+                arg = match.parse(arg)
+            except ValueError:
+                return None
+        return match, [arg]
+
+    def handler(self, *names: str) -> "RouterHandler":
+        """A handler for all routes or only the named ones (e.g. one state of a ConversationHandler)."""
+        return RouterHandler(self, frozenset(names) or None)
+
+    def fallback_handler(self) -> "RouterHandler":
+        """A handler that only catches callback_data no route knows about."""
+        return RouterHandler(self, frozenset(), fallback=True)
+
+
+class RouterHandler(BaseHandler[Update, Any]):
+    __slots__ = ("router", "names", "fallback")
+
+    def __init__(self, router: CallbackRouter, names: Optional[frozenset], fallback: bool = False) -> None:
+        super().__init__(self._unused)
+        self.router = router
+        self.names = names  # None — every route
+        self.fallback = fallback
+
+    @staticmethod
+    async def _unused(update: Update, context: Any) -> None:  # BaseHandler requires a callback
+        raise RuntimeError("RouterHandler dispatches to route callbacks")
+
+    def check_update(self, update: object) -> Optional[Tuple[Route, List[Any]]]:
+        if not isinstance(update, Update) or not update.callback_query:
+            return None
+        data = update.callback_query.data
+        if not isinstance(data, str):
+            return None
+        resolved = self.router.resolve(data)
+        if resolved is None:
+            if self.fallback and self.router.fallback is not None:
+                return self.router.fallback, []
+            return None
+        if self.names is None or resolved[0].name in self.names:
+            return resolved
+        return None
+
+    def collect_additional_context(self, context: Any, update: Update, application: Any,
+                                   check_result: Tuple[Route, List[Any]]) -> None:
+        context.args = check_result[1]
+
+    async def handle_update(self, update: Update, application: Any,
+                            check_result: Tuple[Route, List[Any]], context: Any) -> Any:
+        self.collect_additional_context(context, update, application, check_result)
+        route = check_result[0]
+        observer = self.router.observer
+        if observer is None:
+            return await route.callback(update, context)
+        started = time.perf_counter()
+        try:
+            return await route.callback(update, context)
+        finally:
+            observer(self.router.name, route.name, time.perf_counter() - started)
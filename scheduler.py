@@ -0,0 +1,223 @@
+# -*- coding: utf-8 -*-
+
+"""
+Outbound Telegram API scheduler (plugged in as the bot's rate limiter).
+
+Telegram allows ~30 messages per second overall and ~1 message per second
+per chat. Every request that targets a chat first waits for a token of that
+chat's bucket, then for a token of the global bucket. Global tokens are handed
+out by priority, so replies to users overtake notifications for the admin chat.
+RetryAfter (429) pauses the chat and the global gate and the request is retried.
+"""
+
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from typing import Any, Callable, Coroutine, Dict, List, Optional, Tuple, Union
+
+from telegram.error import RetryAfter
+from telegram.ext import BaseRateLimiter
+
+from tracing import NULL_SPAN, Tracer
+
+logger = logging.getLogger(__name__)
+
+# Priorities (lower goes first). Pass rate_limit_args=<priority> to a bot method to override.
+PRIORITY_USER = 0    # replies in a user's chat
+PRIORITY_ADMIN = 10  # notifications for the admin chat
+PRIORITY_BULK = 20   # digests, exports and other background traffic
+
+
+class TokenBucket:
+    """Token bucket with reservations: reserve() returns how long the caller must wait."""
+
+    __slots__ = ("rate", "burst", "tokens", "stamp", "paused_until")
+
+    def __init__(self, rate: float, burst: float) -> None:
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.stamp = time.monotonic()
+        self.paused_until = 0.0
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.burst, self.tokens + (now - self.stamp) * self.rate)
+        self.stamp = now
+
+    def reserve(self) -> float:
+        now = time.monotonic()
+        self._refill(now)
+        self.tokens -= 1
+        wait = 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+        return max(wait, self.paused_until - now)
+
+    def pause(self, seconds: float) -> None:
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    def idle(self) -> bool:
+        now = time.monotonic()
+        self._refill(now)
+        return self.tokens >= self.burst and self.paused_until <= now
+
+
+class OutboundScheduler(BaseRateLimiter[int]):
+    def __init__(self, admin_chat_id: Optional[int] = None, global_rate: float = 30.0,
+                 chat_rate: float = 1.0, chat_burst: float = 3.0, max_retries: int = 3,
+                 observer: Optional[Callable[[str, float, str], None]] = None,
+                 tracer: Optional[Tracer] = None) -> None:
+        self.admin_chat_id = admin_chat_id
+        # observer(endpoint, seconds, outcome) after every API call; outcome: ok / retry_after / error
+        self.observer = observer
+        # a "telegram" span per attempt: limiter wait (wait_ms) + the call itself
+        self.tracer = tracer
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.max_retries = max_retries
+
+        self._global = TokenBucket(global_rate, global_rate)
+        self._chats: Dict[Any, TokenBucket] = {}
+        self._heap: List[Tuple[int, int, asyncio.Future]] = []
+        self._seq = itertools.count()
+        self._wake: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._waiting_chat = 0
+        self.retries = 0
+
+    # --- observability ---
+
+    @property
+    def queue_depth(self) -> int:
+        """Requests currently held back by the scheduler (per-chat + global)."""
+        return self._waiting_chat + len(self._heap)
+
+    # --- lifecycle ---
+
+    async def initialize(self) -> None:
+        if self._task is None:
+            self._wake = asyncio.Event()
+            self._task = asyncio.create_task(self._dispatch(), name="outbound-scheduler")
+
+    async def shutdown(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        for _, _, fut in self._heap:
+            if not fut.done():
+                fut.cancel()
+        self._heap.clear()
+
+    def _span(self, endpoint: str, **attrs: Any):
+        if self.tracer is None:
+            return NULL_SPAN
+        return self.tracer.span("telegram", root=False, method=endpoint, **attrs)
+
+    async def _call(self, endpoint: str, callback: Callable[..., Coroutine[Any, Any, Any]],
+                    args: Any, kwargs: Dict[str, Any], span=NULL_SPAN) -> Any:
+        if self.observer is None and span is NULL_SPAN:
+            return await callback(*args, **kwargs)
+        started = time.perf_counter()
+        outcome = "error"
+        try:
+            result = await callback(*args, **kwargs)
+            outcome = "ok"
+            return result
+        except RetryAfter:
+            outcome = "retry_after"
+            raise
+        finally:
+            span.set(outcome=outcome)
+            if self.observer is not None:
+                self.observer(endpoint, time.perf_counter() - started, outcome)
+
+    # --- global gate ---
+
+    async def _dispatch(self) -> None:
+        assert self._wake is not None
+        while True:
+            if not self._heap:
+                self._wake.clear()
+                await self._wake.wait()
+                continue
+            wait = self._global.reserve()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            # highest priority waiter gets the token (skip cancelled ones)
+            while self._heap:
+                _, _, fut = heapq.heappop(self._heap)
+                if not fut.done():
+                    fut.set_result(None)
+                    break
+
+    async def _global_slot(self, priority: int) -> None:
+        if self._task is None:
+            await self.initialize()
+        fut = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._heap, (priority, next(self._seq), fut))
+        self._wake.set()
+        await fut
+
+    # --- per-chat buckets ---
+
+    def _chat_bucket(self, chat_id: Any) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            if len(self._chats) > 10000:
+                # forget chats that are idle anyway (full bucket == fresh bucket)
+                self._chats = {k: b for k, b in self._chats.items() if not b.idle()}
+            bucket = self._chats[chat_id] = TokenBucket(self.chat_rate, self.chat_burst)
+        return bucket
+
+    def _priority(self, chat_id: Any, rate_limit_args: Optional[int]) -> int:
+        if rate_limit_args is not None:
+            return rate_limit_args
+        if self.admin_chat_id is not None and str(chat_id) == str(self.admin_chat_id):
+            return PRIORITY_ADMIN
+        return PRIORITY_USER
+
+    async def process_request(
+        self,
+        callback: Callable[..., Coroutine[Any, Any, Union[bool, Dict[str, Any], List[Dict[str, Any]]]]],
+        args: Any,
+        kwargs: Dict[str, Any],
+        endpoint: str,
+        data: Dict[str, Any],
+        rate_limit_args: Optional[int],
+    ) -> Union[bool, Dict[str, Any], List[Dict[str, Any]]]:
+        chat_id = data.get("chat_id")
+        if chat_id is None:
+            # answerCallbackQuery, getFile, setWebhook … are not message-limited
+            with self._span(endpoint) as span:
+                return await self._call(endpoint, callback, args, kwargs, span)
+
+        priority = self._priority(chat_id, rate_limit_args)
+        bucket = self._chat_bucket(chat_id)
+        for attempt in range(self.max_retries + 1):
+            with self._span(endpoint, attempt=attempt, priority=priority) as span:
+                queued = time.perf_counter()
+                wait = bucket.reserve()
+                if wait > 0:
+                    self._waiting_chat += 1
+                    try:
+                        await asyncio.sleep(wait)
+                    finally:
+                        self._waiting_chat -= 1
+                await self._global_slot(priority)
+                span.set(wait_ms=round((time.perf_counter() - queued) * 1000, 3))
+                try:
+                    return await self._call(endpoint, callback, args, kwargs, span)
+                except RetryAfter as exc:
+                    if attempt == self.max_retries:
+                        logger.error("%s to %s: still rate limited after %d retries", endpoint, chat_id, attempt)
+                        raise
+                    self.retries += 1
+                    span.set(retry_after=exc.retry_after)
+                    logger.warning("%s to %s: rate limited, retrying in %ss", endpoint, chat_id, exc.retry_after)
+                    bucket.pause(exc.retry_after)
+                    self._global.pause(exc.retry_after)
+        raise AssertionError("unreachable")
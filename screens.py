@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+
+"""
+Screens (text + inline keyboard) in every language, built once at startup.
+
+The wording lives in message catalogs, one TOML file per language:
+
+    locales/en.toml   the default, has every key
+    locales/ru.toml   may leave keys out, those fall back to the default
+
+A screen is defined once with a catalog key (or a function of the catalog for
+composed texts) and a layout, a function of the catalog returning the button
+rows. define() builds it for every language right away; what a handler does
+per update is two dict lookups:
+
+    SCREENS.get("faq", user.language_code) -> Screen(text, markup)
+
+The keyboards are CompiledMarkup: their JSON is serialized when they are
+built, not on every request. Adding a language is adding a file.
+"""
+
+import json
+import os
+import tomllib
+from typing import Any, Callable, Dict, NamedTuple, Optional, Sequence, Union
+
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+
+Catalog = Dict[str, str]
+Text = Callable[[str], str]  # catalog key -> text in one language
+Layout = Callable[[Text], Sequence[Sequence[InlineKeyboardButton]]]
+
+LOCALES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "locales")
+
+
+class CompiledMarkup(InlineKeyboardMarkup):
+    """InlineKeyboardMarkup with its JSON serialized once.
+
+    PTB serializes a reply_markup with to_dict() + json.dumps() for every
+    request; a str from to_dict() is sent as is (RequestParameter.json_value),
+    so a keyboard shared by all users costs nothing per message.
+    """
+
+    __slots__ = ("_json",)
+
+    def __init__(self, inline_keyboard: Sequence[Sequence[InlineKeyboardButton]]) -> None:
+        super().__init__(inline_keyboard)
+        with self._unfrozen():
+            self._json = json.dumps(super().to_dict())
+
+    def to_dict(self, recursive: bool = True):  # type: ignore[override]
+        return self._json
+
+    def to_json(self) -> str:
+        return self._json
+
+
+class Screen(NamedTuple):
+    text: str
+    markup: Optional[CompiledMarkup] = None
+
+
+def load_catalogs(directory: str = LOCALES_DIR) -> Dict[str, Catalog]:
+    """language -> catalog, from <directory>/<language>.toml."""
+    catalogs = {}
+    for filename in sorted(os.listdir(directory)):
+        language, ext = os.path.splitext(filename)
+        if ext == ".toml":
+            with open(os.path.join(directory, filename), "rb") as f:
+                catalogs[language] = tomllib.load(f)
+    return catalogs
+
+
+class ScreenRegistry:
+    def __init__(self, catalogs: Dict[str, Catalog], default: str = "en") -> None:
+        if default not in catalogs:
+            raise ValueError(f"No catalog for the default language {default!r}")
+        self.default = default
+        base = catalogs[default]
+        self.catalogs: Dict[str, Catalog] = {}
+        for language, catalog in catalogs.items():
+            unknown = sorted(set(catalog) - set(base))
+            if unknown:
+                raise ValueError(f"{language} catalog: unknown keys {', '.join(unknown)}")
+            self.catalogs[language] = {**base, **catalog}
+        self._screens: Dict[str, Dict[str, Screen]] = {language: {} for language in self.catalogs}
+        self._languages: Dict[Optional[str], str] = {}  # language_code -> catalog, memo
+
+    def language(self, code: Optional[str]) -> str:
+        """Catalog for a Telegram language_code ("ru", "en-US", None …)."""
+        language = self._languages.get(code)
+        if language is None:
+            short = (code or "").split("-")[0].lower()
+            language = short if short in self.catalogs else self.default
+            if len(self._languages) < 1000:  # IETF tags; the memo stays small anyway
+                self._languages[code] = language
+        return language
+
+    def text(self, key: str, code: Optional[str] = None, **fields: str) -> str:
+        """Catalog text for dynamic messages; fields are filled in with str.format."""
+        text = self.catalogs[self.language(code)][key]
+        return text.format(**fields) if fields else text
+
+    def define(self, name: str, text: Union[str, Callable[[Text], str]],
+               layout: Optional[Layout] = None) -> None:
+        """Build screen `name` in every language; text is a catalog key or a function of the catalog."""
+        for language, catalog in self.catalogs.items():
+            t = catalog.__getitem__
+            body = t(text) if isinstance(text, str) else text(t)
+            markup = CompiledMarkup([list(row) for row in layout(t)]) if layout is not None else None
+            self._screens[language][name] = Screen(body, markup)
+
+    def get(self, name: str, code: Optional[str] = None) -> Screen:
+        return self._screens[self.language(code)][name]
+
+
+def override(catalogs: Dict[str, Catalog], texts: Dict[str, Any], default: str = "en") -> None:
+    """Apply a bot's [texts] (tenants.py): plain keys replace the default language's
+    wording, tables ([texts.ru]) another language's."""
+    for key, value in texts.items():
+        language, entries = (key, value) if isinstance(value, dict) else (default, {key: value})
+        for name, text in entries.items():
+            if name not in catalogs[default]:
+                raise ValueError(f"[texts] {name}: unknown text")
+            catalogs.setdefault(language, {})[name] = text
@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+
+"""
+User-affinity sharding for running several bot replicas behind one webhook.
+
+Any replica may receive an update from the load balancer. The owner of the
+update's user is chosen by rendezvous (highest random weight) hashing over the
+replica URLs, so ownership is stable and only 1/N of the users move when a
+replica is added or removed. Updates for users owned elsewhere are forwarded
+to the owner as they are; each user therefore has exactly one replica holding
+their conversation state in memory, and every replica shares forms and
+user_data through the same database.
+"""
+
+import hashlib
+import logging
+from typing import Any, Dict, List, Mapping, Optional
+
+from aiohttp import ClientError, ClientSession, ClientTimeout
+
+logger = logging.getLogger(__name__)
+
+FORWARDED_HEADER = "X-Replica-Forwarded"
+
+
+def update_routing_key(data: Mapping[str, Any]) -> Optional[int]:
+    """User id (or chat id) of a raw Update dict, without building telegram objects."""
+    for value in data.values():
+        if not isinstance(value, dict):
+            continue
+        sender = value.get("from") or value.get("user")
+        if isinstance(sender, dict) and "id" in sender:
+            return int(sender["id"])
+        chat = value.get("chat")
+        if isinstance(chat, dict) and "id" in chat:
+            return int(chat["id"])
+    return None
+
+
+def _weight(replica: str, key: int) -> int:
+    digest = hashlib.blake2b(f"{replica}|{key}".encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "big")
+
+
+def owner_index(key: int, replicas: List[str]) -> int:
+    """Index of the replica that owns key (rendezvous hashing)."""
+    return max(range(len(replicas)), key=lambda i: _weight(replicas[i], key))
+
+
+class ReplicaRouter:
+    def __init__(self, replicas: List[str], index: int, timeout: float = 10.0) -> None:
+        if not 0 <= index < len(replicas):
+            raise ValueError(f"REPLICA_INDEX {index} is out of range for {len(replicas)} replicas")
+        self.replicas = [url.rstrip("/") for url in replicas]
+        self.index = index
+        self._timeout = ClientTimeout(total=timeout)
+        self._session: Optional[ClientSession] = None
+        self.forwarded = 0
+        self.forward_failures = 0
+
+    @property
+    def enabled(self) -> bool:
+        return len(self.replicas) > 1
+
+    def owner(self, data: Mapping[str, Any]) -> int:
+        key = update_routing_key(data)
+        if key is None or not self.enabled:
+            return self.index
+        return owner_index(key, self.replicas)
+
+    async def forward(self, owner: int, path: str, body: bytes, headers: Dict[str, str]) -> Optional[int]:
+        """Send the raw webhook request to its owner; returns the HTTP status or None on failure."""
+        if self._session is None:
+            self._session = ClientSession(timeout=self._timeout)
+        url = f"{self.replicas[owner]}{path}"
+        try:
+            async with self._session.post(url, data=body, headers={**headers, FORWARDED_HEADER: str(self.index)}) as resp:
+                self.forwarded += 1
+                return resp.status
+        except (ClientError, OSError, TimeoutError) as e:
+            self.forward_failures += 1
+            logger.warning("Forwarding update to replica %d failed: %s", owner, e)
+            return None
+
+    async def close(self) -> None:
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
@@ -0,0 +1,492 @@
+# -*- coding: utf-8 -*-
+
+"""
+Application (form) storage behind FORMS.
+
+Two backends with the same interface:
+* MemoryFormStore — plain dict, the old behaviour (local runs, experiments).
+* SQLFormStore — the forms table of the database (PostgreSQL, or the SQLite
+  stand-in, see database.py), bounded LRU of hot forms in memory and
+  write-behind batching, so pending applications survive a redeploy and the
+  resident size does not grow with the number of users.
+
+A form is a plain dict of answers; its payment status lives under the "status" key.
+Reads are coroutines: a form that is not in memory is read without blocking
+the event loop.
+
+The admin dashboard (/pending, /applications) pages through submitted forms by
+(submitted_at, user_id) with page(); the database keeps status, submitted_at
+and nationality in indexed columns, so a page is one short index range scan
+(keyset pagination) however many forms there are.
+"""
+
+import abc
+import asyncio
+import json
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, AsyncIterator, Dict, Iterable, List, Optional, Tuple
+
+from database import Database, open_database
+
+logger = logging.getLogger(__name__)
+
+# Payment / processing status of an application
+STATUS_DRAFT = "draft"          # form is being filled in
+STATUS_SUBMITTED = "submitted"  # all 8 steps done, payment block shown
+STATUS_PENDING = "pending"      # user pressed "✅ I paid"
+STATUS_PAID = "paid"            # admin confirmed the payment
+
+Form = Dict[str, Any]
+Cursor = Tuple[float, int]  # (submitted_at, user_id) of a form, position in the dashboard order
+
+
+def submitted_at(form: Form) -> Optional[float]:
+    """When the form was submitted (ms precision, exact in a cursor); None for drafts."""
+    if form.get("status", STATUS_DRAFT) == STATUS_DRAFT:
+        return None
+    # forms submitted before "submitted_at" was recorded: their last change
+    value = form.get("submitted_at", form.get("updated_at"))
+    return round(value, 3) if value is not None else None
+
+
+class FormStore(abc.ABC):
+    """Interface of a form store. user_id -> form dict."""
+
+    @abc.abstractmethod
+    async def get(self, user_id: int) -> Optional[Form]:
+        """The form of a user, None if there is none."""
+
+    @abc.abstractmethod
+    def put(self, user_id: int, form: Form) -> None:
+        """Save (insert or replace) the form of a user."""
+
+    @abc.abstractmethod
+    def delete(self, user_id: int) -> None:
+        """Remove the form of a user (nothing happens if there is none)."""
+
+    @abc.abstractmethod
+    async def ids_by_status(self, status: str) -> List[int]:
+        """user_ids of the forms with this status, sorted."""
+
+    @abc.abstractmethod
+    async def size(self) -> int:
+        """Number of stored forms."""
+
+    async def reload(self, user_id: int) -> Optional[Form]:
+        """Like get(), but bypasses caches — for forms another replica may have changed."""
+        return await self.get(user_id)
+
+    @abc.abstractmethod
+    def iter_forms(self, statuses: Optional[Iterable[str]] = None, since: Optional[float] = None,
+                   until: Optional[float] = None, batch_size: int = 500) -> AsyncIterator[Tuple[int, Form]]:
+        """(user_id, form) by user_id, filtered by status and submitted_at in [since, until);
+        with since or until, forms not submitted yet are left out.
+
+        Reads in batches, so the whole table is never in memory. The database backend
+        only sees flushed forms, call flush() first.
+        """
+
+    @abc.abstractmethod
+    async def page(self, status: Optional[str] = None, nationality: Optional[str] = None,
+                   after: Optional[Cursor] = None, before: Optional[Cursor] = None,
+                   limit: int = 10) -> List[Tuple[int, Form]]:
+        """Submitted forms in (submitted_at, user_id) order: the first `limit` after the
+        cursor, or the last `limit` before it; filtered by status and nationality.
+
+        The database backend only sees flushed forms, call flush() first.
+        """
+
+    @abc.abstractmethod
+    async def count(self, status: Optional[str] = None, nationality: Optional[str] = None) -> int:
+        """Number of submitted forms page() would go through."""
+
+    # --- helpers shared by all backends ---
+
+    def new(self, user_id: int) -> Form:
+        """Start a fresh (empty) form for the user, replacing the previous one."""
+        form: Form = {"status": STATUS_DRAFT}
+        self.put(user_id, form)
+        return form
+
+    async def set_status(self, user_id: int, status: str) -> Optional[Form]:
+        form = await self.get(user_id)
+        if form is None:
+            return None
+        form["status"] = status
+        self.put(user_id, form)
+        return form
+
+    # --- lifecycle (no-op for in-memory backend) ---
+
+    async def start(self) -> None:
+        pass
+
+    async def flush(self) -> None:
+        pass
+
+    async def close(self) -> None:
+        pass
+
+
+class MemoryFormStore(FormStore):
+    def __init__(self) -> None:
+        self._forms: Dict[int, Form] = {}
+
+    async def get(self, user_id: int) -> Optional[Form]:
+        return self._forms.get(user_id)
+
+    def put(self, user_id: int, form: Form) -> None:
+        form["updated_at"] = time.time()
+        self._forms[user_id] = form
+
+    def delete(self, user_id: int) -> None:
+        self._forms.pop(user_id, None)
+
+    async def ids_by_status(self, status: str) -> List[int]:
+        return sorted(uid for uid, form in self._forms.items() if form.get("status") == status)
+
+    async def size(self) -> int:
+        return len(self._forms)
+
+    async def iter_forms(self, statuses: Optional[Iterable[str]] = None, since: Optional[float] = None,
+                         until: Optional[float] = None, batch_size: int = 500) -> AsyncIterator[Tuple[int, Form]]:
+        wanted = set(statuses) if statuses is not None else None
+        for uid in sorted(self._forms):
+            form = self._forms.get(uid)
+            if form is None or (wanted is not None and form.get("status") not in wanted):
+                continue
+            if since is not None or until is not None:
+                when = submitted_at(form)
+                if when is None or (since is not None and when < since) or (until is not None and when >= until):
+                    continue
+            yield uid, form
+
+    def _submitted(self, status: Optional[str], nationality: Optional[str]) -> List[Tuple[Cursor, int, Form]]:
+        # no indexes here: a sort of every form (local runs, experiments)
+        rows = []
+        for uid, form in self._forms.items():
+            when = submitted_at(form)
+            if when is None or (status is not None and form.get("status") != status):
+                continue
+            if nationality is not None and form.get("nationality") != nationality:
+                continue
+            rows.append(((when, uid), uid, form))
+        rows.sort(key=lambda row: row[0])
+        return rows
+
+    async def page(self, status: Optional[str] = None, nationality: Optional[str] = None,
+                   after: Optional[Cursor] = None, before: Optional[Cursor] = None,
+                   limit: int = 10) -> List[Tuple[int, Form]]:
+        rows = self._submitted(status, nationality)
+        if before is not None:
+            return [(uid, form) for key, uid, form in rows if key < before][-limit:]
+        return [(uid, form) for key, uid, form in rows if after is None or key > after][:limit]
+
+    async def count(self, status: Optional[str] = None, nationality: Optional[str] = None) -> int:
+        return len(self._submitted(status, nationality))
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS forms (
+    user_id      INTEGER PRIMARY KEY,
+    status       TEXT NOT NULL,
+    data         TEXT NOT NULL,
+    updated_at   REAL NOT NULL,
+    submitted_at REAL,
+    nationality  TEXT
+);
+"""
+
+# after _migrate(): older tables get the columns first
+_INDEXES = """
+CREATE INDEX IF NOT EXISTS forms_status_idx ON forms (status, user_id);
+CREATE INDEX IF NOT EXISTS forms_submitted_idx ON forms (submitted_at, user_id);
+CREATE INDEX IF NOT EXISTS forms_status_submitted_idx ON forms (status, submitted_at, user_id);
+CREATE INDEX IF NOT EXISTS forms_nationality_idx ON forms (nationality, submitted_at, user_id);
+"""
+
+_DELETED = object()  # marker in the write-behind buffer
+_MISSING = object()  # not in memory, read the database
+
+
+class SQLFormStore(FormStore):
+    """The forms table with an LRU of hot forms and write-behind batching.
+
+    Reads go LRU -> write-behind buffer -> database (primary key lookup).
+    Writes only touch memory; a background task flushes the buffer every
+    `flush_interval` seconds or as soon as `flush_batch` forms are dirty.
+    start() creates the table.
+    """
+
+    def __init__(self, database: Database, cache_size: int = 1000,
+                 flush_interval: float = 1.0, flush_batch: int = 100) -> None:
+        self.db = database
+        self.cache_size = cache_size
+        self.flush_interval = flush_interval
+        self.flush_batch = flush_batch
+
+        self._cache: "OrderedDict[int, Form]" = OrderedDict()
+        self._dirty: Dict[int, Any] = {}  # user_id -> form | _DELETED
+        self._inflight: Dict[int, Any] = {}  # batch being written by the flusher
+        # flush() is called by the write-behind loop, the dashboards and export; one batch at a time
+        self._flush_lock = asyncio.Lock()
+        self._wake: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._closing = False
+
+    async def _create(self) -> None:
+        await self.db.script(_SCHEMA)
+        await self._migrate()
+        await self.db.script(_INDEXES)
+
+    async def _migrate(self) -> None:
+        if "submitted_at" in await self.db.columns("forms"):
+            return
+        # table from before the dashboard: add the indexed columns and fill them from the forms
+        try:
+            await self.db.script("ALTER TABLE forms ADD COLUMN submitted_at REAL;"
+                                 "ALTER TABLE forms ADD COLUMN nationality TEXT;")
+        except Exception:
+            if "nationality" not in await self.db.columns("forms"):
+                raise
+            return  # another replica was faster
+        rows = await self.db.fetch("SELECT user_id, data FROM forms WHERE status != ?", (STATUS_DRAFT,))
+        await self.db.write([(
+            "UPDATE forms SET submitted_at = ?, nationality = ? WHERE user_id = ?",
+            [(submitted_at(form), form.get("nationality"), uid)
+             for uid, form in ((uid, json.loads(data)) for uid, data in rows)],
+        )])
+
+    # --- cache ---
+
+    def _remember(self, user_id: int, form: Form) -> None:
+        self._cache[user_id] = form
+        self._cache.move_to_end(user_id)
+        while len(self._cache) > self.cache_size:
+            # dirty forms stay reachable through self._dirty until flushed
+            self._cache.popitem(last=False)
+
+    def _local(self, user_id: int) -> Any:
+        """The form from memory (None if deleted), _MISSING if only the database has it."""
+        form = self._cache.get(user_id)
+        if form is not None:
+            self._cache.move_to_end(user_id)
+            return form
+        pending = self._dirty.get(user_id, self._inflight.get(user_id))
+        if pending is _DELETED:
+            return None
+        if pending is not None:
+            self._remember(user_id, pending)
+            return pending
+        return _MISSING
+
+    async def _fetch_forms(self, sql: str, params: List[Any]) -> List[Tuple[int, Form]]:
+        rows = await self.db.fetch(sql, params)
+        # decoded in a worker thread, a batch is up to 500 forms
+        return await asyncio.to_thread(lambda: [(uid, json.loads(data)) for uid, data in rows])
+
+    # --- FormStore ---
+
+    async def get(self, user_id: int) -> Optional[Form]:
+        form = self._local(user_id)
+        if form is not _MISSING:
+            return form
+        rows = await self.db.fetch("SELECT data FROM forms WHERE user_id = ?", (user_id,))
+        # put() or another get() while the database was read: the form in memory wins
+        form = self._local(user_id)
+        if form is not _MISSING:
+            return form
+        if not rows:
+            return None
+        form = json.loads(rows[0][0])
+        self._remember(user_id, form)
+        return form
+
+    async def reload(self, user_id: int) -> Optional[Form]:
+        if user_id in self._dirty or user_id in self._inflight:
+            return await self.get(user_id)  # our own change is newer than the database
+        self._cache.pop(user_id, None)
+        return await self.get(user_id)
+
+    def put(self, user_id: int, form: Form) -> None:
+        form["updated_at"] = time.time()
+        form.setdefault("status", STATUS_DRAFT)
+        self._remember(user_id, form)
+        self._dirty[user_id] = form
+        if len(self._dirty) >= self.flush_batch and self._wake is not None:
+            self._wake.set()
+
+    def delete(self, user_id: int) -> None:
+        self._cache.pop(user_id, None)
+        self._dirty[user_id] = _DELETED
+
+    def _unflushed(self) -> Dict[int, Any]:
+        return {**self._inflight, **self._dirty}
+
+    async def ids_by_status(self, status: str) -> List[int]:
+        rows = await self.db.fetch("SELECT user_id FROM forms WHERE status = ? ORDER BY user_id", (status,))
+        unflushed = self._unflushed()
+        ids = {r[0] for r in rows}
+        # overlay changes that are not flushed yet
+        for uid, form in unflushed.items():
+            if form is not _DELETED and form.get("status") == status:
+                ids.add(uid)
+            else:
+                ids.discard(uid)
+        return sorted(ids)
+
+    async def size(self) -> int:
+        unflushed = self._unflushed()
+        total = (await self.db.fetch("SELECT COUNT(*) FROM forms"))[0][0]
+        stored = set()
+        if unflushed:
+            marks = ",".join("?" * len(unflushed))
+            stored = {r[0] for r in await self.db.fetch(
+                f"SELECT user_id FROM forms WHERE user_id IN ({marks})", list(unflushed))}
+        for uid, form in unflushed.items():
+            if form is _DELETED and uid in stored:
+                total -= 1
+            elif form is not _DELETED and uid not in stored:
+                total += 1
+        return total
+
+    async def iter_forms(self, statuses: Optional[Iterable[str]] = None, since: Optional[float] = None,
+                         until: Optional[float] = None, batch_size: int = 500) -> AsyncIterator[Tuple[int, Form]]:
+        where, params = ["user_id > ?"], []
+        if statuses is not None:
+            statuses = list(statuses)
+            where.append(f"status IN ({','.join('?' * len(statuses))})")
+            params += statuses
+        if since is not None:
+            where.append("submitted_at >= ?")
+            params.append(since)
+        if until is not None:
+            where.append("submitted_at < ?")
+            params.append(until)
+        sql = f"SELECT user_id, data FROM forms WHERE {' AND '.join(where)} ORDER BY user_id LIMIT ?"
+
+        last = -1 << 63
+        while True:
+            # keyset pagination: each batch is a short primary key range scan
+            rows = await self._fetch_forms(sql, [last, *params, batch_size])
+            for uid, form in rows:
+                yield uid, form
+            if len(rows) < batch_size:
+                return
+            last = rows[-1][0]
+
+    def _where(self, status: Optional[str], nationality: Optional[str]) -> Tuple[List[str], List[Any]]:
+        where: List[str] = ["submitted_at IS NOT NULL"]
+        params: List[Any] = []
+        if status is not None:
+            where.append("status = ?")
+            params.append(status)
+        if nationality is not None:
+            where.append("nationality = ?")
+            params.append(nationality)
+        return where, params
+
+    async def page(self, status: Optional[str] = None, nationality: Optional[str] = None,
+                   after: Optional[Cursor] = None, before: Optional[Cursor] = None,
+                   limit: int = 10) -> List[Tuple[int, Form]]:
+        where, params = self._where(status, nationality)
+        order = "ASC"
+        if before is not None:
+            # the page before: walk the index backwards from the cursor, then restore the order
+            where.append("(submitted_at, user_id) < (?, ?)")
+            params += list(before)
+            order = "DESC"
+        elif after is not None:
+            where.append("(submitted_at, user_id) > (?, ?)")
+            params += list(after)
+        sql = (f"SELECT user_id, data FROM forms WHERE {' AND '.join(where)} "
+               f"ORDER BY submitted_at {order}, user_id {order} LIMIT ?")
+        rows = await self.db.fetch(sql, [*params, limit])
+        if order == "DESC":
+            rows.reverse()
+        return [(uid, json.loads(data)) for uid, data in rows]
+
+    async def count(self, status: Optional[str] = None, nationality: Optional[str] = None) -> int:
+        where, params = self._where(status, nationality)
+        return (await self.db.fetch(f"SELECT COUNT(*) FROM forms WHERE {' AND '.join(where)}", params))[0][0]
+
+    # --- write-behind ---
+
+    def _take_batch(self) -> Tuple[List[Tuple[Any, ...]], List[int]]:
+        """Serialize dirty forms on the event loop (handlers may mutate them concurrently)."""
+        upserts, deletes = [], []
+        self._inflight, self._dirty = self._dirty, {}
+        for uid, form in self._inflight.items():
+            if form is _DELETED:
+                deletes.append(uid)
+            else:
+                upserts.append((uid, form.get("status", STATUS_DRAFT),
+                                json.dumps(form, ensure_ascii=False), form.get("updated_at", time.time()),
+                                submitted_at(form), form.get("nationality")))
+        return upserts, deletes
+
+    async def _write(self, upserts: List[Tuple[Any, ...]], deletes: List[int]) -> None:
+        await self.db.write([
+            ("INSERT INTO forms (user_id, status, data, updated_at, submitted_at, nationality) "
+             "VALUES (?, ?, ?, ?, ?, ?) "
+             "ON CONFLICT(user_id) DO UPDATE SET status = excluded.status, "
+             "data = excluded.data, updated_at = excluded.updated_at, "
+             "submitted_at = excluded.submitted_at, nationality = excluded.nationality", upserts),
+            ("DELETE FROM forms WHERE user_id = ?", [(uid,) for uid in deletes]),
+        ])
+
+    async def flush(self) -> None:
+        # a second caller waits for the batch being written, then writes what is left:
+        # _inflight has to stay readable (and re-queueable) until its batch is committed
+        async with self._flush_lock:
+            if not self._dirty:
+                return
+            upserts, deletes = self._take_batch()
+            try:
+                await self._write(upserts, deletes)
+            except Exception:
+                logger.exception("Failed to flush %d forms to %s", len(upserts) + len(deletes), self.db.name)
+                # put them back unless they were changed again meanwhile
+                for uid, form in self._inflight.items():
+                    self._dirty.setdefault(uid, form)
+            finally:
+                self._inflight = {}
+
+    async def _flush_loop(self) -> None:
+        assert self._wake is not None
+        while not self._closing:
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            await self.flush()
+
+    async def start(self) -> None:
+        if self._task is None:
+            await self._create()
+            self._closing = False
+            self._wake = asyncio.Event()
+            self._task = asyncio.create_task(self._flush_loop(), name="forms-write-behind")
+            logger.info("Form store: %s (%d forms)", self.db.name, await self.size())
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._closing = True
+            self._wake.set()
+            await self._task
+            self._task = None
+        await self.flush()
+        await self.db.close()
+
+
+def open_store(backend: str, database: str, **kwargs: Any) -> FormStore:
+    """Create the form store configured by FORMS_BACKEND ("database" or "memory");
+    database is a postgres:// URL or an SQLite file (see open_database())."""
+    if backend == "memory":
+        return MemoryFormStore()
+    if backend in ("database", "sqlite"):  # "sqlite": its name before PostgreSQL
+        return SQLFormStore(open_database(database), **kwargs)
+    raise ValueError(f"Unknown FORMS_BACKEND: {backend!r}")
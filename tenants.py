@@ -0,0 +1,221 @@
+# -*- coding: utf-8 -*-
+
+"""
+Several bots in one process (TENANTS_DIR=<directory>, see boot.py).
+
+Every *.toml file in the directory is one bot. Its keys are the settings bot.py
+otherwise reads from the environment; they take precedence, everything not set
+falls back to the environment (shared defaults). Optional [texts] replaces
+catalog texts (locales/*.toml, see screens.py) of the default language,
+[texts.<language>] those of another:
+
+    # tenants/russia.toml
+    BOT_TOKEN = "123456:ABC…"
+    ADMIN_CHAT_ID = 7782365882
+    PAYPAL_URL = "https://www.paypal.com/cgi-bin/webscr?cmd=_xclick&business=…"
+
+    [texts]
+    START_TEXT = "…"
+
+    [texts.ru]
+    START_TEXT = "…"
+
+The file name is the bot's name (or NAME = "…"); it prefixes its routes
+(/t/<name>/telegram/<path>, /t/<name>/paypal/ipn, /t/<name>/export), its log
+lines ("tenant") and its metrics (tenant="<name>"). Forms, conversation state
+and documents go to TENANTS_DATA_DIR/<name>/ unless the file sets the paths.
+
+Each bot is its own instance of the bot.py module (bot_<name> in sys.modules),
+so the module-level state (FORMS, REAPER, PAYMENTS, …) stays per bot without
+changes to the handlers. What a bot costs on top is that state and its
+Application; the interpreter, the imported libraries, the aiohttp server, the
+HTTP connection pool to the Bot API (SharedHTTPXRequest) and the document
+worker processes (documents.py) are shared.
+
+TOML, because tomllib is in the standard library; YAML would need PyYAML.
+"""
+
+import asyncio
+import importlib.util
+import logging
+import os
+import re
+import sys
+import tomllib
+from collections import Counter
+from types import ModuleType
+from typing import Any, Dict, List, Optional
+
+import httpx
+from aiohttp import web
+from telegram.request import HTTPXRequest
+
+from metrics import REGISTRY, CONTENT_TYPE as METRICS_CONTENT_TYPE, render_all
+
+logger = logging.getLogger(__name__)
+
+TENANTS_DATA_DIR = os.getenv("TENANTS_DATA_DIR", "tenants-data")
+SHARED_POOL_SIZE = int(os.getenv("SHARED_POOL_SIZE", "256"))  # connections to the Bot API, all bots
+
+BOT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bot.py")
+NAME_RE = re.compile(r"^[a-z0-9][a-z0-9_-]{0,31}$")  # goes into URLs and module names
+
+# per-bot files under TENANTS_DATA_DIR/<name>/ unless the config sets them
+DATA_FILES = {
+    "FORMS_DB_PATH": "forms.sqlite3",
+    "STATE_DB_PATH": "forms.sqlite3",
+    "PAYMENTS_DB_PATH": "forms.sqlite3",
+    "STATE_SNAPSHOT_PATH": "state.pickle",
+    "DOCUMENTS_DIR": "documents",
+}
+
+
+# =========================
+# Shared Bot API connections
+# =========================
+
+class SharedHTTPXRequest(HTTPXRequest):
+    """HTTPXRequest on one httpx client for the whole process.
+
+    Timeouts are passed per request, so getUpdates long polls and normal calls
+    of all bots can use the same pool. Closed once by close_shared(), not by
+    the Applications.
+    """
+
+    _shared: Optional[httpx.AsyncClient] = None
+
+    def __init__(self) -> None:
+        super().__init__(connection_pool_size=SHARED_POOL_SIZE)
+
+    def _build_client(self) -> httpx.AsyncClient:
+        cls = SharedHTTPXRequest
+        if cls._shared is None or cls._shared.is_closed:
+            cls._shared = super()._build_client()
+        return cls._shared
+
+    async def shutdown(self) -> None:
+        pass  # other bots still use the client
+
+    @classmethod
+    async def close_shared(cls) -> None:
+        if cls._shared is not None:
+            await cls._shared.aclose()
+            cls._shared = None
+
+
+# =========================
+# Loading
+# =========================
+
+def read_config(path: str) -> Dict[str, Any]:
+    with open(path, "rb") as f:
+        config = tomllib.load(f)
+    name = str(config.get("NAME") or os.path.splitext(os.path.basename(path))[0])
+    if not NAME_RE.match(name):
+        raise ValueError(f"{path}: bot name {name!r} must match {NAME_RE.pattern}")
+    if not config.get("BOT_TOKEN"):
+        raise ValueError(f"{path}: BOT_TOKEN is required")
+    config["NAME"] = name
+
+    data_dir = os.path.join(TENANTS_DATA_DIR, name)
+    os.makedirs(data_dir, exist_ok=True)
+    for key, filename in DATA_FILES.items():
+        config.setdefault(key, os.path.join(data_dir, filename))
+    if "DATABASE_URL" not in config and os.getenv("DATABASE_URL"):
+        # the same tables for every bot: forms of one bot would show up in another
+        raise ValueError(f"{path}: set DATABASE_URL per bot (its own database), not in the environment")
+    # tracing is opt-in: TRACE_FILE in the config, or in the environment for every bot (each in its own directory)
+    if "TRACE_FILE" not in config and os.getenv("TRACE_FILE"):
+        config["TRACE_FILE"] = os.path.join(data_dir, "traces.jsonl")
+    public = os.getenv("WEBHOOK_BASE_URL") or os.getenv("RENDER_EXTERNAL_URL", "")
+    if public and "WEBHOOK_BASE_URL" not in config:
+        config["WEBHOOK_BASE_URL"] = f"{public.rstrip('/')}/t/{name}"
+    return config
+
+
+def load_bot(config: Dict[str, Any]) -> ModuleType:
+    """A separate instance of bot.py configured by config."""
+    spec = importlib.util.spec_from_file_location(f"bot_{config['NAME']}", BOT_PATH)
+    module = importlib.util.module_from_spec(spec)
+    module.TENANT = config  # read by bot.py before anything else
+    sys.modules[spec.name] = module
+    try:
+        spec.loader.exec_module(module)
+    except BaseException:
+        del sys.modules[spec.name]
+        raise
+    return module
+
+
+def load_tenants(directory: str) -> List[ModuleType]:
+    paths = sorted(
+        os.path.join(directory, f) for f in os.listdir(directory) if f.endswith(".toml")
+    )
+    if not paths:
+        raise RuntimeError(f"No bot configs (*.toml) in {directory}")
+    configs = [read_config(path) for path in paths]
+    for field in ("NAME", "BOT_TOKEN"):
+        repeated = [value for value, n in Counter(str(c[field]) for c in configs).items() if n > 1]
+        if repeated:
+            # the same token twice would make the bots steal each other's updates
+            raise ValueError(f"{field} used by more than one bot config in {directory}")
+    return [load_bot(config) for config in configs]
+
+
+# =========================
+# Serving
+# =========================
+
+class TenantStartup:
+    """One bot's view of boot.STARTUP: prefixed phases and routes, shared readiness."""
+
+    def __init__(self, parent, name: str, states: Dict[str, str]) -> None:
+        self.parent = parent
+        self.name = name
+        self.states = states  # name -> state, of all bots
+
+    def mark(self, phase: str) -> None:
+        self.parent.mark(f"{self.name}/{phase}")
+
+    def serve(self, handlers: Dict[str, Any]) -> None:
+        # "metrics" of the single bot is replaced by the combined one (serve_all)
+        self.parent.serve({f"{self.name}/{key}": handler for key, handler in handlers.items()})
+
+    def set_state(self, state: str) -> None:
+        self.states[self.name] = state
+        if state == "ready":
+            if all(s == "ready" for s in self.states.values()):
+                self.parent.set_state("ready")
+        elif self.parent.state != state:
+            self.parent.set_state(state)  # stopping or failed: the process is no longer ready
+
+
+def _metrics_handler(bots: List[ModuleType]):
+    async def _metrics(request: web.Request) -> web.Response:
+        await asyncio.gather(*(bot.refresh_metrics() for bot in bots))
+        body = render_all([REGISTRY] + [bot.REGISTRY for bot in bots])
+        return web.Response(body=body.encode(), headers={"Content-Type": METRICS_CONTENT_TYPE})
+
+    return _metrics
+
+
+async def serve_all(bots: List[ModuleType], stop: asyncio.Event, startup) -> None:
+    """Run all bots on this loop until stop is set; one failing stops the others."""
+    states = {bot.TENANT_NAME: "starting" for bot in bots}
+    startup.serve({"metrics": _metrics_handler(bots)})
+    tasks = [
+        asyncio.create_task(bot.serve(stop, TenantStartup(startup, bot.TENANT_NAME, states)),
+                            name=f"bot-{bot.TENANT_NAME}")
+        for bot in bots
+    ]
+    logger.info("Hosting %d bots: %s", len(bots), ", ".join(states))
+    try:
+        done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+        failed = [task for task in done if not task.cancelled() and task.exception() is not None]
+        if failed:
+            stop.set()  # the others drain and stop as on SIGTERM
+        await asyncio.gather(*tasks, return_exceptions=True)
+        if failed:
+            raise failed[0].exception()
+    finally:
+        await SharedHTTPXRequest.close_shared()
@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+
+import asyncio
+from types import SimpleNamespace
+
+from database import open_database
+from digest import DatabaseDigestStore, PendingDigest
+
+
+def test_presses_are_coalesced_into_one_paged_digest(tmp_path):
+    async def run():
+        sent = []
+
+        async def send(text, markup):
+            sent.append((text, markup))
+            return SimpleNamespace(message_id=500 + len(sent))
+
+        async def is_paid(user_id: int) -> bool:
+            return user_id == 7
+
+        path = str(tmp_path / "forms.sqlite3")
+        digest = PendingDigest(send, window=3600, page_size=3, is_done=is_paid,
+                               store=DatabaseDigestStore(open_database(path)))
+        added = [digest.add(uid, f"User {uid}", f"Application of {uid}") for uid in range(1, 8)]
+        repeated = digest.add(3, "User 3", "again")
+        await digest.flush()
+        again = digest.add(3, "User 3", "pressed after the digest")
+        # the admin pages it on another replica
+        replica = PendingDigest(send, page_size=3, is_done=is_paid, store=DatabaseDigestStore(open_database(path)))
+        try:
+            return (added, repeated, again, sent, await replica.page(501, 2), await replica.page(501),
+                    await replica.page(999))
+        finally:
+            await digest.close()
+            await replica.close()
+
+    added, repeated, again, sent, last, on_screen, unknown = asyncio.run(run())
+    assert added == [True] * 7
+    assert repeated is False and again is False
+    assert len(sent) == 1
+    text, markup = sent[0]
+    assert text.startswith("⏳ Payment pending (7) — page 1/3")
+    assert "\n\nagain" in text and "Application of 3" not in text  # the latest details win
+    assert "Application of 4" not in text
+    buttons = [button.callback_data for row in markup.inline_keyboard for button in row]
+    assert buttons == ["admin_mark_paid:1", "admin_mark_paid:2", "admin_mark_paid:3", "pending_page:1"]
+
+    text, markup = last
+    assert "page 3/3" in text and "✅ confirmed\nApplication of 7" in text
+    assert [button.callback_data for row in markup.inline_keyboard for button in row] == ["pending_page:1"]
+    assert "page 3/3" in on_screen[0]  # the page shown last is remembered
+    assert unknown is None
@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+
+import io
+import os
+
+import pytest
+
+Image = pytest.importorskip("PIL.Image")  # Pillow is optional, see documents.py
+
+from documents import THUMB_SIZE, combine_pdf, normalize_upload  # noqa: E402
+
+
+def _jpeg(width: int, height: int, orientation: int = 1) -> bytes:
+    exif = Image.Exif()
+    exif[0x0112] = orientation
+    out = io.BytesIO()
+    Image.new("RGB", (width, height), "white").save(out, "JPEG", exif=exif)
+    return out.getvalue()
+
+
+def test_normalize_upload_rotates_upright_and_writes_a_thumbnail(tmp_path):
+    meta = normalize_upload(_jpeg(400, 300, orientation=6), str(tmp_path), "scan")  # 6: rotated 90° in EXIF
+    assert meta["image"] is True and (meta["width"], meta["height"]) == (300, 400)
+    with Image.open(tmp_path / "scan.thumb.jpg") as thumb:
+        assert max(thumb.size) == THUMB_SIZE
+
+
+def test_normalize_upload_keeps_other_documents_as_they_are(tmp_path):
+    meta = normalize_upload(b"%PDF-1.4 not an image", str(tmp_path), "doc")
+    assert meta["image"] is False and meta["size"] == 21
+    assert os.listdir(tmp_path) == []
+
+
+def test_combine_pdf_has_a_page_per_image(tmp_path):
+    pages = []
+    for i, size in enumerate([(400, 300), (300, 400)]):
+        normalize_upload(_jpeg(*size), str(tmp_path), f"p{i}")
+        pages.append(str(tmp_path / f"p{i}.page.jpg"))
+    pdf = combine_pdf(pages)
+    assert pdf.startswith(b"%PDF") and pdf.count(b"/Type /Page\n") == 2
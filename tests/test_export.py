@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+
+import asyncio
+import csv
+import io
+import zipfile
+from types import SimpleNamespace
+
+import pytest
+
+from export import ExportOptions, export_zip
+from store import STATUS_DRAFT, STATUS_PAID, STATUS_PENDING, MemoryFormStore
+
+JAN_10 = 1768003200.0  # 2026-01-10 00:00 UTC
+DAY = 86400.0
+
+
+class _Bot:
+    """getFile + download of the Bot API, from a dict file_id -> (bytes, file_path)."""
+
+    def __init__(self, files):
+        self.files = files
+
+    async def get_file(self, file_id):
+        if file_id not in self.files:
+            raise RuntimeError("file is too big")
+        data, path = self.files[file_id]
+
+        async def download_as_bytearray():
+            return bytearray(data)
+
+        return SimpleNamespace(file_path=path, download_as_bytearray=download_as_bytearray)
+
+
+def _export(options: ExportOptions):
+    async def run():
+        store = MemoryFormStore()
+        store.put(1, {"status": STATUS_PAID, "full_name": "Ана", "submitted_at": JAN_10,
+                      "passport_file_id": "p1", "photo_file_id": "f1", "photo_file_kind": "photo"})
+        # submitted before the window; its updated_at does not matter
+        store.put(2, {"status": STATUS_PENDING, "submitted_at": JAN_10 - 5 * DAY, "passport_file_id": "gone"})
+        store.put(3, {"status": STATUS_PENDING, "submitted_at": JAN_10 + DAY, "passport_file_id": "gone"})
+        store.put(4, {"status": STATUS_DRAFT})
+        bot = _Bot({"p1": (b"%PDF-1.4", "documents/file_1.pdf"), "f1": (b"\xff\xd8jpeg", None)})
+        chunks = []
+
+        async def write(data: bytes) -> None:
+            chunks.append(data)
+
+        stats = await export_zip(store, bot, options, write, concurrency=2)
+        return stats, zipfile.ZipFile(io.BytesIO(b"".join(chunks)))
+
+    return asyncio.run(run())
+
+
+def test_export_filters_by_submission_date_and_streams_documents():
+    stats, archive = _export(ExportOptions.parse({"since": "2026-01-10", "until": "2026-01-12"}))
+    rows = list(csv.DictReader(io.StringIO(archive.read("applications.csv").decode("utf-8"))))
+    assert [row["user_id"] for row in rows] == ["1", "3"]
+    assert rows[0]["full_name"] == "Ана"
+    assert archive.read("documents/1/passport.pdf") == b"%PDF-1.4"
+    assert archive.read("documents/1/photo.jpg") == b"\xff\xd8jpeg"
+    assert (stats.forms, stats.documents, stats.failed) == (2, 2, 1)
+    assert "2 applications, 2 documents (1 failed)" in archive.read("README.txt").decode()
+
+
+def test_export_jsonl_without_documents():
+    stats, archive = _export(ExportOptions.parse({"status": "pending", "format": "jsonl", "docs": "no"}))
+    assert archive.namelist() == ["applications.jsonl", "README.txt"]
+    assert archive.read("applications.jsonl").decode().count("\n") == 2
+    assert stats.documents == 0
+
+
+@pytest.mark.parametrize("params", [{"since": "10.01.2026"}, {"format": "xml"}, {"sort": "name"}])
+def test_export_options_reject_bad_input(params):
+    with pytest.raises(ValueError):
+        ExportOptions.parse(params)
@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+
+import asyncio
+import time
+
+from telegram import Update
+
+from lanes import UserLaneUpdateProcessor
+
+
+def _update(update_id: int, user_id: int) -> Update:
+    return Update.de_json({
+        "update_id": update_id,
+        "message": {"message_id": update_id, "date": 0, "text": "x",
+                    "chat": {"id": user_id, "type": "private"},
+                    "from": {"id": user_id, "is_bot": False, "first_name": "U"}},
+    }, None)
+
+
+def test_busy_user_does_not_block_others():
+    # an album of 10 slow updates from A must not take the 4 slots from B
+    async def run():
+        processor = UserLaneUpdateProcessor(4, lane_depth=16)
+        order = []
+
+        async def handle(name: str, seconds: float) -> None:
+            await asyncio.sleep(seconds)
+            order.append(name)
+
+        tasks = [asyncio.create_task(processor.process_update(_update(i, 1), handle(f"a{i}", 0.1)))
+                 for i in range(10)]
+        await asyncio.sleep(0)
+        started = time.perf_counter()
+        await processor.process_update(_update(100, 2), handle("b", 0))
+        waited = time.perf_counter() - started
+        await asyncio.gather(*tasks)
+        return order, waited
+
+    order, waited = asyncio.run(run())
+    assert waited < 0.05
+    assert order.index("b") == 0
+    assert [name for name in order if name != "b"] == [f"a{i}" for i in range(10)]  # A in order
+
+
+def test_lane_depth_drops_extra_updates():
+    async def run():
+        processor = UserLaneUpdateProcessor(4, lane_depth=2)
+
+        async def handle() -> None:
+            await asyncio.sleep(0.01)
+
+        await asyncio.gather(*(processor.process_update(_update(i, 1), handle()) for i in range(5)))
+        return processor
+
+    processor = asyncio.run(run())
+    assert processor.dropped == 3
+    assert processor.active_lanes == 0 and processor.in_flight == 0
+
+
+def test_concurrency_limit_still_applies():
+    async def run():
+        processor = UserLaneUpdateProcessor(2)
+        running = peak = 0
+
+        async def handle() -> None:
+            nonlocal running, peak
+            running += 1
+            peak = max(peak, running)
+            await asyncio.sleep(0.01)
+            running -= 1
+
+        await asyncio.gather(*(processor.process_update(_update(i, i), handle()) for i in range(6)))
+        return peak
+
+    assert asyncio.run(run()) == 2
+
+
+def test_cancel_stops_running_and_waiting_updates():
+    async def run():
+        processor = UserLaneUpdateProcessor(4)
+
+        async def handle() -> None:
+            await asyncio.sleep(10)
+
+        # one running on user 1's lane, one waiting behind it
+        tasks = [asyncio.create_task(processor.process_update(_update(i, 1), handle())) for i in range(2)]
+        await asyncio.sleep(0)
+        cancelled = processor.cancel()
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+        return cancelled, results, processor
+
+    cancelled, results, processor = asyncio.run(run())
+    assert cancelled == 2
+    assert all(isinstance(result, asyncio.CancelledError) for result in results)
+    assert processor.in_flight == 0 and processor.active_lanes == 0
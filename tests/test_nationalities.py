@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+
+import pytest
+
+from nationalities import NationalityIndex
+
+ELIGIBLE = "Austria, Germany, Iran, Mexico, North Korea, Romania, Turkey."
+
+
+@pytest.fixture
+def index() -> NationalityIndex:
+    return NationalityIndex.from_text(ELIGIBLE)
+
+
+def test_lookup_folds_case_diacritics_and_aliases(index):
+    assert index.lookup("  TÜRKIYE ") == "Turkey"
+    assert index.lookup("german") == "Germany"
+    assert index.lookup("north-korean") == "North Korea"
+    assert index.lookup("Australia") is None
+
+
+@pytest.mark.parametrize("text", ["korea", "South Korea", "Ukrainian", "American"])
+def test_ineligible_input_is_not_offered_an_eligible_country(index, text):
+    assert index.lookup(text) is None
+    assert index.complete(text) == []
+    assert index.similar(text) == []
+
+
+def test_complete_matches_the_start_of_a_name_only(index):
+    assert index.complete("ger") == ["Germany"]
+    assert index.complete("north k") == ["North Korea"]
+    assert index.complete("kor") == []
+    assert index.complete("ira") == ["Iran"]
+
+
+def test_similar_catches_typos(index):
+    assert index.similar("germny") == ["Germany"]
+    assert index.similar("Romnia") == ["Romania"]
+
+
+def test_close_spelling_of_another_country_is_no_completion(index):
+    # shown as a "did you mean" text at most, never as a set_nat button (bot.form_nationality_text)
+    assert index.complete("Australia") == []
+    assert index.similar("Australia") == ["Austria"]
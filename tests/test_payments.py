@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+
+import asyncio
+from urllib.parse import urlencode
+
+import pytest
+from aiohttp import web
+
+from payments import PaymentReconciler, order_ref, parse_order_ref, payment_url
+
+SECRET = "s3cret"
+
+
+def test_order_ref_round_trip():
+    assert parse_order_ref(order_ref(42, SECRET), SECRET) == 42
+    assert parse_order_ref(f" {order_ref(42, SECRET)} ", SECRET) == 42
+
+
+@pytest.mark.parametrize("ref", [
+    order_ref(42, "other secret"),          # signed with another secret
+    order_ref(42, SECRET)[:-1] + "0",       # tampered signature
+    "43-" + order_ref(42, SECRET).partition("-")[2],  # signature of another user
+    "-5-abc", "42", "", None,
+])
+def test_parse_order_ref_rejects_foreign_refs(ref):
+    assert parse_order_ref(ref, SECRET) is None
+
+
+def test_parse_order_ref_needs_a_secret():
+    assert parse_order_ref(order_ref(42, ""), "") is None
+
+
+def test_payment_url():
+    assert payment_url("https://pay.example/{order_ref}", "42-ab") == "https://pay.example/42-ab"
+    assert (payment_url("https://www.paypal.com/cgi-bin/webscr?cmd=_xclick", "42-ab", "https://bot/ipn")
+            == "https://www.paypal.com/cgi-bin/webscr?cmd=_xclick&invoice=42-ab&notify_url=https%3A%2F%2Fbot%2Fipn")
+
+
+def _ipn(txn_id: str, user_id: int = 42, amount: str = "125.00", status: str = "Completed") -> bytes:
+    return urlencode({"txn_id": txn_id, "payment_status": status, "mc_gross": amount, "mc_currency": "USD",
+                      "receiver_email": "shop@example.com", "invoice": order_ref(user_id, SECRET)}).encode()
+
+
+def _run_ipn(tmp_path, verdict: str, bodies):
+    """Post the notifications to a reconciler whose PayPal (a local server) answers verdict."""
+    async def run():
+        verified = []
+
+        async def verify(request: web.Request) -> web.Response:
+            verified.append(await request.read())
+            return web.Response(text=verdict)
+
+        app = web.Application()
+        app.router.add_post("/verify", verify)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        port = runner.addresses[0][1]
+
+        confirmed, notices = [], []
+
+        async def confirm(user_id: int, txn_id: str) -> bool:
+            confirmed.append((user_id, txn_id))
+            return True
+
+        async def notify(text: str) -> None:
+            notices.append(text)
+
+        reconciler = PaymentReconciler(str(tmp_path / "payments.sqlite3"), f"http://127.0.0.1:{port}/verify",
+                                       SECRET, "125.00", "USD", receiver_email="shop@example.com",
+                                       confirm=confirm, notify=notify, interval=3600)
+        await reconciler.start()
+        try:
+            statuses = []
+            for body in bodies:
+                statuses.append(await reconciler.handle(body))
+                if reconciler._applying:
+                    await asyncio.wait(reconciler._applying)
+            counts = await reconciler.ledger.counts()
+        finally:
+            await reconciler.close()
+            await runner.cleanup()
+        return statuses, verified, confirmed, notices, counts
+
+    return asyncio.run(run())
+
+
+def test_verified_ipn_confirms_the_application_once(tmp_path):
+    body = _ipn("TXN1")
+    statuses, verified, confirmed, notices, counts = _run_ipn(tmp_path, "VERIFIED", [body, body])
+    assert statuses == [200, 200]
+    assert verified[0] == b"cmd=_notify-validate&" + body  # sent back verbatim
+    assert confirmed == [(42, "TXN1")]  # PayPal's retry is not applied again
+    assert notices == [] and counts == {"applied": 1}
+
+
+def test_invalid_ipn_is_ignored(tmp_path):
+    statuses, _, confirmed, notices, counts = _run_ipn(tmp_path, "INVALID", [_ipn("TXN1")])
+    assert statuses == [200]
+    assert confirmed == [] and notices == [] and counts == {}
+
+
+def test_short_payment_goes_to_the_admin(tmp_path):
+    statuses, _, confirmed, notices, counts = _run_ipn(tmp_path, "VERIFIED", [_ipn("TXN1", amount="12.50")])
+    assert statuses == [200]
+    assert confirmed == []
+    assert len(notices) == 1 and "amount 12.50 USD" in notices[0]
+    assert counts == {"problem": 1}
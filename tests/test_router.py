@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+
+import pytest
+
+from dashboard import PREFIX, View
+from router import CallbackRouter, number
+from store import STATUS_PENDING
+
+NATIONALITIES = ["Iran", "Mexico"]
+
+
+async def _noop(update, context):
+    pass
+
+
+@pytest.fixture
+def router() -> CallbackRouter:
+    router = CallbackRouter(name="menu")
+    router.add("apply", _noop)
+    router.add_prefix("set_nat:", _noop)
+    router.add_prefix("admin_mark_paid:", _noop, parse=number)
+    router.add_prefix("admin_mark_paid:all:", _noop, name="mark_all")
+    router.add_prefix(PREFIX, _noop, parse=lambda data: View.parse(data, NATIONALITIES), name="dashboard_page")
+    return router
+
+
+def _resolved(router, data):
+    found = router.resolve(data)
+    return None if found is None else (found[0].name, found[1])
+
+
+def test_exact_and_prefix_routes(router):
+    assert _resolved(router, "apply") == ("apply", [])
+    assert _resolved(router, "set_nat:Iran") == ("set_nat", ["Iran"])
+    assert _resolved(router, "admin_mark_paid:42") == ("admin_mark_paid", [42])
+    assert _resolved(router, "admin_mark_paid:all:x")[0] == "mark_all"  # the longest prefix wins
+    assert _resolved(router, "unknown") is None
+
+
+@pytest.mark.parametrize("arg", ["-5", " 5", "+5", "5 ", "٥", "", "1e3"])
+def test_ids_are_plain_digits(router, arg):
+    assert _resolved(router, f"admin_mark_paid:{arg}") is None
+
+
+def test_dashboard_callback_round_trip(router):
+    view = View(STATUS_PENDING, "Mexico", page=2, total=25)
+    data = view.callback(">", (1768003200.123, 42), 3, NATIONALITIES)
+    name, [(parsed, direction, cursor)] = _resolved(router, data)
+    assert name == "dashboard_page" and direction == ">" and cursor == (1768003200.123, 42)
+    assert (parsed.status, parsed.nationality, parsed.page, parsed.total) == (STATUS_PENDING, "Mexico", 3, 25)
+
+
+@pytest.mark.parametrize("data", ["-1::^:1:5", "2:-1:^:1:5", "2::>-5.1:1:5", "2::^:+1:5", "9::^:1:5", "2::?:1:5"])
+def test_dashboard_rejects_malformed_callbacks(router, data):
+    assert _resolved(router, PREFIX + data) is None
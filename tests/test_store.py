@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+
+import asyncio
+
+from store import STATUS_PAID, STATUS_PENDING, STATUS_SUBMITTED, MemoryFormStore, open_store
+
+
+def _store(path):
+    return open_store("database", str(path), flush_interval=3600)
+
+
+def _submitted(when: float, status: str = STATUS_SUBMITTED, nationality: str = "Iran") -> dict:
+    return {"status": status, "submitted_at": when, "nationality": nationality}
+
+
+def test_forms_survive_a_restart(tmp_path):
+    async def run():
+        store = _store(tmp_path / "forms.sqlite3")
+        await store.start()
+        store.put(1, {"status": STATUS_SUBMITTED, "name": "Ана"})
+        store.put(2, {"status": STATUS_PENDING})
+        store.new(3)
+        assert (await store.get(1))["name"] == "Ана"  # from memory, not flushed yet
+        assert await store.size() == 3
+        await store.flush()
+        store.delete(2)
+        assert await store.size() == 2  # the unflushed delete counts
+        await store.close()  # flushes the rest
+
+        store = _store(tmp_path / "forms.sqlite3")
+        await store.start()
+        try:
+            return (await store.get(1), await store.get(2), await store.size(),
+                    await store.ids_by_status(STATUS_SUBMITTED))
+        finally:
+            await store.close()
+
+    form, deleted, size, submitted = asyncio.run(run())
+    assert form["name"] == "Ана" and form["status"] == STATUS_SUBMITTED
+    assert deleted is None
+    assert size == 2
+    assert submitted == [1]
+
+
+def test_reload_reads_what_another_replica_flushed(tmp_path):
+    async def run():
+        mine, theirs = _store(tmp_path / "forms.sqlite3"), _store(tmp_path / "forms.sqlite3")
+        await mine.start()
+        await theirs.start()
+        mine.put(1, {"status": STATUS_PENDING})
+        await mine.flush()
+        cached = await theirs.get(1)
+        mine.put(1, {"status": STATUS_PAID})
+        await mine.flush()
+        try:
+            return cached, await theirs.get(1), await theirs.reload(1)
+        finally:
+            await mine.close()
+            await theirs.close()
+
+    cached, stale, fresh = asyncio.run(run())
+    assert cached["status"] == STATUS_PENDING
+    assert stale["status"] == STATUS_PENDING  # get() serves the cached form
+    assert fresh["status"] == STATUS_PAID
+
+
+def _pages(store):
+    async def run():
+        await store.start()
+        for uid in range(1, 8):
+            store.put(uid, _submitted(100.0 + uid // 2, nationality="Iran" if uid % 2 else "Mexico"))
+        store.put(8, {"status": "draft"})
+        store.put(9, _submitted(150.0, status=STATUS_PAID))
+        await store.flush()
+        try:
+            first = await store.page(limit=3)
+            last = first[-1]
+            cursor = (last[1]["submitted_at"], last[0])
+            second = await store.page(after=cursor, limit=3)
+            back = await store.page(before=(second[0][1]["submitted_at"], second[0][0]), limit=3)
+            return ([uid for uid, _ in first], [uid for uid, _ in second], [uid for uid, _ in back],
+                    [uid for uid, _ in await store.page(status=STATUS_SUBMITTED, nationality="Mexico")],
+                    await store.count(), await store.count(status=STATUS_PAID),
+                    [uid async for uid, _ in store.iter_forms(since=102.0, until=103.0)])
+        finally:
+            await store.close()
+
+    return asyncio.run(run())
+
+
+def test_page_walks_submitted_forms_by_cursor(tmp_path):
+    first, second, back, mexico, total, paid, window = _pages(_store(tmp_path / "forms.sqlite3"))
+    # submitted_at 100.0: 1; 101.0: 2, 3; 102.0: 4, 5; 103.0: 6, 7; 150.0: 9 — ties in user_id order
+    assert first == [1, 2, 3]
+    assert second == [4, 5, 6]
+    assert back == [1, 2, 3]
+    assert mexico == [2, 4, 6]
+    assert total == 8 and paid == 1  # drafts are not listed
+    assert window == [4, 5]
+
+
+def test_memory_store_pages_the_same(tmp_path):
+    assert _pages(MemoryFormStore()) == _pages(_store(tmp_path / "forms.sqlite3"))
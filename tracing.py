@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+
+"""
+Per-update trace spans, written as JSON lines to a rotating local file.
+
+A trace starts when an update is dispatched (lanes.py) and collects nested
+spans: the handler (bot.instrumented), safe_edit_or_send and every Bot API
+call including its rate limiter wait and retries (scheduler.py). The current
+span lives in a contextvar, so spans opened further down — and in tasks
+created from a handler — attach to the right parent without passing anything
+around. One line per finished span:
+
+    {"trace": "9f…", "span": "1a2b3c4d", "parent": "…", "name": "telegram",
+     "start": 1760781234.123, "ms": 41.7, "method": "sendMessage", "attempt": 0, "outcome": "ok"}
+
+Whether a trace is kept is decided once at its root (sample_rate); spans of a
+dropped trace cost one contextvar lookup. Lines are written by a listener
+thread, like the logs (logs.py); when its queue is full spans are dropped and
+counted.
+"""
+
+import contextvars
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import time
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+_CURRENT: "contextvars.ContextVar[Optional[Any]]" = contextvars.ContextVar("trace_span", default=None)
+
+
+class Span:
+    __slots__ = ("tracer", "name", "trace_id", "span_id", "parent_id", "attrs", "start", "_started", "_token")
+
+    def __init__(self, tracer: "Tracer", name: str, trace_id: str, parent_id: Optional[str],
+                 attrs: Dict[str, Any]) -> None:
+        self.tracer = tracer
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = f"{random.getrandbits(32):08x}"
+        self.parent_id = parent_id
+        self.attrs = attrs
+        self.start = 0.0
+        self._started = 0.0
+        self._token: Optional[contextvars.Token] = None
+
+    def set(self, **attrs: Any) -> None:
+        self.attrs.update(attrs)
+
+    def __enter__(self) -> "Span":
+        self.start = time.time()
+        self._started = time.perf_counter()
+        self._token = _CURRENT.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        _CURRENT.reset(self._token)
+        if exc_type is not None:
+            self.attrs.setdefault("error", exc_type.__name__)
+        self.tracer._emit(self, time.perf_counter() - self._started)
+        return False
+
+
+class _NullSpan:
+    """Span of a trace that is not recorded (tracing off or not sampled)."""
+
+    __slots__ = ("_token",)
+    trace_id = None
+
+    def set(self, **attrs: Any) -> None:
+        pass
+
+    def __enter__(self) -> "_NullSpan":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        return False
+
+
+class _Unsampled(_NullSpan):
+    """Root of a dropped trace: marks the context, so the spans below it are not sampled again."""
+
+    __slots__ = ()
+
+    def __enter__(self) -> "_Unsampled":
+        self._token = _CURRENT.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        _CURRENT.reset(self._token)
+        return False
+
+
+NULL_SPAN = _NullSpan()
+
+
+class _JsonLine(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        return json.dumps(record.msg, ensure_ascii=False, default=str)
+
+
+class Tracer:
+    def __init__(self, path: str, sample_rate: float = 1.0, max_bytes: int = 10 * 1024 * 1024,
+                 backups: int = 3, queue_size: int = 10000) -> None:
+        self.path = path  # "" — tracing off
+        self.sample_rate = sample_rate
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self._queue: "queue.Queue[logging.LogRecord]" = queue.Queue(queue_size)
+        self._listener: Optional[logging.handlers.QueueListener] = None
+        self.dropped = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self._listener is not None
+
+    def span(self, name: str, root: bool = True, **attrs: Any):
+        """Context manager for a span below the current one.
+
+        Without a current span a new trace is started, or with root=False nothing
+        is recorded (Bot API calls outside an update: getUpdates, digests …).
+        """
+        if self._listener is None:
+            return NULL_SPAN
+        parent = _CURRENT.get()
+        if parent is None:
+            if not root or random.random() >= self.sample_rate:
+                return _Unsampled()
+            return Span(self, name, f"{random.getrandbits(64):016x}", None, attrs)
+        if parent.trace_id is None:
+            return NULL_SPAN
+        return Span(self, name, parent.trace_id, parent.span_id, attrs)
+
+    def current_trace(self) -> Optional[str]:
+        span = _CURRENT.get()
+        return span.trace_id if span is not None else None
+
+    def _emit(self, span: Span, seconds: float) -> None:
+        data = {"trace": span.trace_id, "span": span.span_id, "parent": span.parent_id, "name": span.name,
+                "start": round(span.start, 6), "ms": round(seconds * 1000, 3)}
+        data.update(span.attrs)
+        try:
+            self._queue.put_nowait(logging.makeLogRecord({"msg": data}))
+        except queue.Full:
+            self.dropped += 1
+
+    def start(self) -> None:
+        if self._listener is not None or not self.path:
+            return
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        output = logging.handlers.RotatingFileHandler(
+            self.path, maxBytes=self.max_bytes, backupCount=self.backups, encoding="utf-8", delay=True)
+        output.setFormatter(_JsonLine())
+        self._listener = logging.handlers.QueueListener(self._queue, output)
+        self._listener.start()
+        logger.info("Tracing to %s (sample rate %.2f)", self.path, self.sample_rate)
+
+    def close(self) -> None:
+        if self._listener is not None:
+            listener, self._listener = self._listener, None
+            listener.stop()  # writes out what is still queued
+            for handler in listener.handlers:
+                handler.close()